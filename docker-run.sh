@@ -25,7 +25,7 @@ if [ "$1" == "shell" ]; then
 fi
 
 if [ "$1" == "worker" ]; then
-    exec /ve/bin/python manage.py celery worker
+    exec /ve/bin/python manage.py run_tasks
 fi
 
 if [ "$1" == "beat" ]; then
@@ -9,7 +9,7 @@ from django.utils.safestring import mark_safe
 from writlarge.main.models import (
     LearningSite, ArchivalRepository, ArchivalCollection, DigitalObject,
     LearningSiteCategory, ArchivalRecordFormat, Place, ExtendedDate,
-    Audience, InstructionalLevel, ArchivalCollectionSuggestion)
+    Audience, InstructionalLevel, ArchivalCollectionSuggestion, Task)
 
 
 class LatLongWidget(MultiWidget):
@@ -101,6 +101,13 @@ class ArchivalCollectionSuggestionAdmin(admin.ModelAdmin):
         "Convert to ArchivalCollection"
 
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'modified_at')
+
+
 admin.site.register(Audience)
 admin.site.register(InstructionalLevel)
 admin.site.register(DigitalObject)
@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import Group
 
+from writlarge.main.utils import bump_cache_version, editor_version_name
+
 
 class EditorMapper(object):
     """ if the user is in one of the specified wind affil groups,
@@ -13,6 +15,9 @@ class EditorMapper(object):
             self.groups = settings.WIND_STAFF_MAPPER_GROUPS
 
     def map(self, user, affils):
+        # forget any editor status remembered in the user's sessions
+        bump_cache_version(editor_version_name(user.pk))
+
         for affil in affils:
             if affil in self.groups:
                 (grp, created) = Group.objects.get_or_create(name='Editor')
@@ -0,0 +1,293 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from writlarge.main.models import (
+    ArchivalCollection, ArchivalRepository, DigitalObject, LearningSite,
+    LearningSiteRelationship, Place)
+from writlarge.main.utils import is_postgresql
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+
+def edtf(dt):
+    return dt.edtf_format if dt else None
+
+
+def point(place):
+    return list(place.latlng.coords) if place and place.latlng else None
+
+
+def join(values):
+    # matches the import_sites convention for multiple values in a cell
+    return '|'.join(str(value) for value in values)
+
+
+class Echo(object):
+    """A file-like object that hands back what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+class Export(object):
+    """
+    Stream every row of one model as CSV, newline-delimited JSON or a
+    GeoJSON FeatureCollection. Rows are read through a server-side
+    cursor in chunks, so memory stays flat whatever the corpus size.
+    """
+    fields = ()
+    chunk_size = 1000
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def to_row(self, obj):
+        raise NotImplementedError
+
+    def get_coordinates(self, obj):
+        return None
+
+    def get_geometry(self, obj):
+        return None
+
+    def rows(self):
+        for obj in self.get_queryset().iterator(chunk_size=self.chunk_size):
+            yield (obj, self.to_row(obj))
+
+    def stream(self, fmt):
+        # one read only snapshot across the cursor and prefetch queries,
+        # unless a caller's transaction is already open
+        snapshot = is_postgresql() and not connection.in_atomic_block
+        with transaction.atomic():
+            if snapshot:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL '
+                                   'REPEATABLE READ READ ONLY')
+            yield from getattr(self, 'stream_{}'.format(fmt))()
+
+    def stream_csv(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for (obj, row) in self.rows():
+            yield writer.writerow([
+                join(value) if isinstance(value, list) else value
+                for value in (row[field] for field in self.fields)])
+
+    def stream_ndjson(self):
+        for (obj, row) in self.rows():
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+    def stream_geojson(self):
+        yield '{"type":"FeatureCollection","features":['
+        separator = ''
+        for (obj, row) in self.rows():
+            feature = {
+                'type': 'Feature',
+                'id': row['id'],
+                'geometry': self.get_geometry(obj),
+                'properties': row
+            }
+            yield separator + json.dumps(feature, cls=DjangoJSONEncoder)
+            separator = ','
+        yield ']}'
+
+
+class PointExport(Export):
+
+    def get_geometry(self, obj):
+        coordinates = self.get_coordinates(obj)
+        if coordinates is None:
+            return None
+        return {'type': 'Point', 'coordinates': coordinates}
+
+
+class LearningSiteExport(Export):
+    fields = (
+        'id', 'title', 'description', 'category', 'group',
+        'instructional_level', 'target_audience', 'tags', 'established',
+        'defunct', 'is_defunct', 'founder', 'corporate_body', 'notes',
+        'verified', 'places', 'created_at', 'modified_at')
+
+    def get_queryset(self):
+        return LearningSite.objects.select_related(
+            'established', 'defunct').prefetch_related(
+            'category', 'instructional_level', 'target_audience', 'tags',
+            'place').order_by('id')
+
+    def get_geometry(self, obj):
+        points = [point(place) for place in obj.place.all()]
+        if not points:
+            return None
+        return {'type': 'MultiPoint', 'coordinates': points}
+
+    def to_row(self, obj):
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'description': obj.description,
+            'category': [c.name for c in obj.category.all()],
+            'group': obj.site_group,
+            'instructional_level': [
+                level.name for level in obj.instructional_level.all()],
+            'target_audience': [a.name for a in obj.target_audience.all()],
+            'tags': obj.tags_display(),
+            'established': edtf(obj.established),
+            'defunct': edtf(obj.defunct),
+            'is_defunct': obj.is_defunct,
+            'founder': obj.founder,
+            'corporate_body': obj.corporate_body,
+            'notes': obj.notes,
+            'verified': obj.verified,
+            'places': ['{},{}'.format(p.latitude(), p.longitude())
+                       for p in obj.place.all()],
+            'created_at': obj.created_at,
+            'modified_at': obj.modified_at,
+        }
+
+
+class PlaceExport(PointExport):
+    fields = (
+        'id', 'title', 'latitude', 'longitude', 'start_date', 'end_date',
+        'is_ended', 'created_at', 'modified_at')
+
+    def get_queryset(self):
+        return Place.objects.select_related(
+            'start_date', 'end_date').order_by('id')
+
+    def get_coordinates(self, obj):
+        return point(obj)
+
+    def to_row(self, obj):
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'latitude': obj.latitude(),
+            'longitude': obj.longitude(),
+            'start_date': edtf(obj.start_date),
+            'end_date': edtf(obj.end_date),
+            'is_ended': obj.is_ended,
+            'created_at': obj.created_at,
+            'modified_at': obj.modified_at,
+        }
+
+
+class ArchivalRepositoryExport(PointExport):
+    fields = (
+        'id', 'title', 'description', 'notes', 'place', 'latitude',
+        'longitude', 'created_at', 'modified_at')
+
+    def get_queryset(self):
+        return ArchivalRepository.objects.select_related(
+            'place').order_by('id')
+
+    def get_coordinates(self, obj):
+        return point(obj.place)
+
+    def to_row(self, obj):
+        coordinates = point(obj.place) or [None, None]
+        return {
+            'id': obj.id,
+            'title': obj.title,
+            'description': obj.description,
+            'notes': obj.notes,
+            'place': obj.place_id,
+            'latitude': coordinates[1],
+            'longitude': coordinates[0],
+            'created_at': obj.created_at,
+            'modified_at': obj.modified_at,
+        }
+
+
+class ArchivalCollectionExport(PointExport):
+    fields = (
+        'id', 'collection_title', 'repository', 'repository_title',
+        'description', 'learning_sites', 'finding_aid_url', 'linear_feet',
+        'record_format', 'inclusive_start', 'inclusive_end', 'notes',
+        'created_at', 'modified_at')
+
+    def get_queryset(self):
+        return ArchivalCollection.objects.select_related(
+            'repository__place', 'inclusive_start',
+            'inclusive_end').prefetch_related(
+            'learning_sites', 'record_format').order_by('id')
+
+    def get_coordinates(self, obj):
+        return point(obj.repository.place)
+
+    def to_row(self, obj):
+        return {
+            'id': obj.id,
+            'collection_title': obj.collection_title,
+            'repository': obj.repository_id,
+            'repository_title': obj.repository.title,
+            'description': obj.description,
+            'learning_sites': [site.id for site in obj.learning_sites.all()],
+            'finding_aid_url': obj.finding_aid_url,
+            'linear_feet': obj.linear_feet,
+            'record_format': [f.name for f in obj.record_format.all()],
+            'inclusive_start': edtf(obj.inclusive_start),
+            'inclusive_end': edtf(obj.inclusive_end),
+            'notes': obj.notes,
+            'created_at': obj.created_at,
+            'modified_at': obj.modified_at,
+        }
+
+
+class DigitalObjectExport(Export):
+    fields = (
+        'id', 'description', 'url', 'source', 'date_taken', 'datestamp',
+        'learning_sites', 'created_at', 'modified_at')
+
+    def get_queryset(self):
+        return DigitalObject.objects.select_related(
+            'date_taken').prefetch_related('learningsite_set').order_by('id')
+
+    def to_row(self, obj):
+        return {
+            'id': obj.id,
+            'description': obj.description,
+            'url': obj.get_url(),
+            'source': obj.source,
+            'date_taken': edtf(obj.date_taken),
+            'datestamp': obj.datestamp,
+            'learning_sites': [
+                site.id for site in obj.learningsite_set.all()],
+            'created_at': obj.created_at,
+            'modified_at': obj.modified_at,
+        }
+
+
+class RelationshipExport(Export):
+    fields = (
+        'id', 'site_one', 'site_one_title', 'site_two', 'site_two_title')
+
+    def get_queryset(self):
+        return LearningSiteRelationship.objects.select_related(
+            'site_one', 'site_two').order_by('id')
+
+    def to_row(self, obj):
+        return {
+            'id': obj.id,
+            'site_one': obj.site_one_id,
+            'site_one_title': obj.site_one.title,
+            'site_two': obj.site_two_id,
+            'site_two_title': obj.site_two.title,
+        }
+
+
+EXPORTS = {
+    'site': LearningSiteExport,
+    'place': PlaceExport,
+    'repository': ArchivalRepositoryExport,
+    'collection': ArchivalCollectionExport,
+    'digitalobject': DigitalObjectExport,
+    'relationship': RelationshipExport,
+}
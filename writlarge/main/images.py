@@ -0,0 +1,90 @@
+import hashlib
+from io import BytesIO
+import os
+import warnings
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# name: bounding box, the longest side is scaled down to fit
+SIZES = {
+    'thumbnail': (320, 320),
+    'display': (1200, 1200),
+}
+
+# extension: Pillow format & save options. Neither passes exif or icc
+# data along, so camera metadata is stripped from every derivative.
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+}
+
+
+class Derivative(object):
+
+    def __init__(self, name, ext, content, size):
+        self.name = name
+        self.ext = ext
+        self.content = content
+        (self.width, self.height) = size
+
+    def filename(self, source):
+        # a digest of the content keeps every name cacheable forever
+        (root, ext) = os.path.splitext(source)
+        digest = hashlib.sha256(self.content).hexdigest()[:12]
+        return 'derivatives/{}-{}.{}.{}'.format(
+            root, self.name, digest, self.ext)
+
+
+def open_image(f):
+    """
+    Returns an upright RGB copy of the image in f, or None when f is
+    not an image Pillow can read
+    """
+    try:
+        with warnings.catch_warnings():
+            # refuse anything past MAX_IMAGE_PIXELS rather than decode it
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(f)
+            image.load()
+        image = ImageOps.exif_transpose(image)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning,
+            UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # flatten transparency onto white, jpeg has no alpha channel
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+
+    return image.convert('RGB')
+
+
+def render(image, box, ext):
+    copy = image.copy()
+    if copy.width > box[0] or copy.height > box[1]:
+        copy.thumbnail(box, Image.Resampling.LANCZOS)
+
+    (fmt, options) = FORMATS[ext]
+    buf = BytesIO()
+    copy.save(buf, fmt, **options)
+    return (buf.getvalue(), copy.size)
+
+
+def make_derivatives(f):
+    """
+    Returns ((width, height), [Derivative]) for an uploaded image,
+    every size in every format, or None if f is not an image
+    """
+    image = open_image(f)
+    if image is None:
+        return None
+
+    derivatives = []
+    for (name, box) in SIZES.items():
+        for ext in FORMATS:
+            (content, size) = render(image, box, ext)
+            derivatives.append(Derivative(name, ext, content, size))
+    return (image.size, derivatives)
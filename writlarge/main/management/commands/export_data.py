@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, OutputWrapper
+
+from writlarge.main.export import EXPORTS, FORMATS
+
+
+class Command(BaseCommand):
+    help = ('Export every site, place, repository, collection, digital '
+            'object or relationship as CSV, newline-delimited JSON or '
+            'GeoJSON. Rows are streamed, so memory use stays flat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS.keys()))
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS.keys()), default='csv')
+        parser.add_argument(
+            '--output', help='file to write, defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def write(self, out, export, fmt):
+        for chunk in export.stream(fmt):
+            out.write(chunk, ending='')
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options['kind']]()
+        export.chunk_size = options['chunk_size']
+
+        if options['output'] is None:
+            self.write(self.stdout, export, options['format'])
+            return
+
+        with open(options['output'], 'w', newline='',
+                  encoding='utf-8') as out:
+            self.write(OutputWrapper(out), export, options['format'])
@@ -0,0 +1,296 @@
+import csv
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+from django.db.models import Case, TextField, Value, When
+from taggit.models import Tag
+
+from writlarge.main.models import (
+    Audience, ExtendedDate, InstructionalLevel, LearningSite,
+    LearningSiteCategory, Place, PlaceManager)
+from writlarge.main.utils import (
+    bump_cache_version, is_postgresql, tile_cache)
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Bulk import learning sites from a CSV file, or a JSON file '
+            'with one site object per line. Multiple categories, levels, '
+            'audiences, tags & places are separated by | in CSV cells or '
+            'given as lists in JSON. Places are "latitude,longitude".')
+
+    lookups = {
+        'category': LearningSiteCategory,
+        'instructional_level': InstructionalLevel,
+        'target_audience': Audience,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=['csv', 'json'],
+            help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--user', help='username recorded as each site\'s creator')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='validate the file without saving anything')
+
+    # reading
+
+    def read_rows(self, path, fmt):
+        with open(path, newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                yield from csv.DictReader(f)
+                return
+
+            # a single array has to be read whole, so prefer one per line
+            if f.read(1) == '[':
+                f.seek(0)
+                yield from json.load(f)
+                return
+
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def split(self, value):
+        if isinstance(value, list):
+            values = value
+        else:
+            values = (value or '').split('|')
+
+        # repeats within a cell would duplicate the m2m through rows
+        seen = set()
+        result = []
+        for v in values:
+            v = str(v).strip()
+            if v and v.lower() not in seen:
+                seen.add(v.lower())
+                result.append(v)
+        return result
+
+    def flag(self, value, default):
+        value = str(value).strip().lower() if value is not None else ''
+        if value in ('true', 'yes', '1'):
+            return True
+        if value in ('false', 'no', '0'):
+            return False
+        return default
+
+    # resolving
+
+    def load_lookups(self):
+        self.objects = {}
+        for field, model in self.lookups.items():
+            self.objects[field] = {
+                obj.name.lower(): obj for obj in model.objects.all()}
+        self.load_tags()
+        self.titles = set(
+            LearningSite.objects.values_list('title', flat=True))
+        self.dates = {}
+
+    def load_tags(self):
+        self.tags = {tag.name.lower(): tag for tag in Tag.objects.all()}
+
+    def resolve(self, field, names):
+        objects = []
+        for name in names:
+            obj = self.objects[field].get(name.lower())
+            if obj is None:
+                raise RowError('unknown {} "{}"'.format(field, name))
+            objects.append(obj)
+        return objects
+
+    def parse_date(self, text):
+        text = str(text).strip() if text is not None else ''
+        if not text:
+            return None
+
+        if text not in self.dates:
+            dt = ExtendedDate.objects.from_string(text)
+            self.dates[text] = dt.edtf_format if dt else None
+
+        if self.dates[text] is None:
+            raise RowError('unrecognized date "{}"'.format(text))
+
+        dt = ExtendedDate(edtf_format=self.dates[text])
+        dt._set_internal_dates()
+        return dt
+
+    def parse_places(self, row, title):
+        places = []
+        for latlng in self.split(row.get('places')):
+            try:
+                point = PlaceManager.string_to_point(latlng)
+            except (IndexError, ValueError):
+                raise RowError('invalid place "{}"'.format(latlng))
+            places.append(Place(title=title, latlng=point))
+        return places
+
+    def parse_row(self, row):
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise RowError('missing title')
+        if title in self.titles:
+            raise RowError('"{}" already exists'.format(title))
+
+        site = LearningSite(
+            title=title,
+            description=row.get('description') or None,
+            founder=row.get('founder') or None,
+            corporate_body=row.get('corporate_body') or None,
+            notes=row.get('notes') or None,
+            verified=self.flag(row.get('verified'), False),
+            created_by=self.user,
+            modified_by=self.user)
+
+        site.established = self.parse_date(row.get('established'))
+        site.defunct = self.parse_date(row.get('defunct'))
+        site.is_defunct = self.flag(row.get('is_defunct'), True)
+
+        record = {
+            'site': site,
+            'places': self.parse_places(row, title),
+            'tags': self.split(row.get('tags')),
+        }
+        for field in self.lookups:
+            record[field] = self.resolve(field, self.split(row.get(field)))
+
+        for key, value in site.compute_date_fields().items():
+            setattr(site, key, value)
+
+        categories = sorted(record['category'], key=lambda c: c.name)
+        site.site_group = categories[0].group if categories else 'other'
+        site.is_empty = not categories
+
+        self.titles.add(title)
+        return record
+
+    # writing
+
+    def get_tags(self, names):
+        tags = []
+        for name in names:
+            if name.lower() not in self.tags:
+                self.tags[name.lower()] = Tag.objects.create(name=name)
+            tags.append(self.tags[name.lower()])
+        return tags
+
+    def write_relations(self, records):
+        for field in self.lookups:
+            descriptor = getattr(LearningSite, field)
+            through = descriptor.through
+            column = descriptor.field.m2m_reverse_field_name()
+            through.objects.bulk_create([
+                through(learningsite=r['site'], **{column: obj})
+                for r in records for obj in r[field]])
+
+        through = LearningSite.place.through
+        through.objects.bulk_create([
+            through(learningsite=r['site'], place=place)
+            for r in records for place in r['places']])
+
+        tagged = LearningSite.tags.through
+        tagged.objects.bulk_create([
+            tagged(content_object=r['site'], tag=tag)
+            for r in records for tag in self.get_tags(r['tags'])])
+
+    @transaction.atomic
+    def write_batch(self, records):
+        dates = [dt for r in records
+                 for dt in (r['site'].established, r['site'].defunct) if dt]
+        ExtendedDate.objects.bulk_create(dates)
+        Place.objects.bulk_create([p for r in records for p in r['places']])
+        LearningSite.objects.bulk_create([r['site'] for r in records])
+
+        self.write_relations(records)
+        self.write_search_vectors(records)
+
+    def write_search_vectors(self, records):
+        if not is_postgresql():
+            return
+
+        names = Case(*[
+            When(pk=r['site'].pk, then=Value(' '.join(
+                [c.name for c in r['category']] + r['tags'])))
+            for r in records], default=Value(''), output_field=TextField())
+        LearningSite.objects.filter(
+            pk__in=[r['site'].pk for r in records]).update(
+            search_vector=LearningSite.search_vector_expression(names))
+
+    def flush(self, batch):
+        if batch and not self.dry_run:
+            try:
+                self.write_batch(batch)
+            except DatabaseError as e:
+                self.fail_batch(batch, e)
+                return
+        self.imported += len(batch)
+
+        if batch and self.verbosity > 0:
+            self.stdout.write('{} {} sites...'.format(
+                'Checked' if self.dry_run else 'Imported', self.imported))
+
+    def fail_batch(self, batch, error):
+        self.errors += len(batch)
+        self.stderr.write('Batch of {} sites failed: {}'.format(
+            len(batch), error))
+
+        # the rollback took any tags this batch created along with it
+        self.load_tags()
+        for r in batch:
+            self.titles.discard(r['site'].title)
+
+    def get_user(self, username):
+        if username is None:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError('Unknown user "{}"'.format(username))
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1][1:].lower()
+        if fmt not in ('csv', 'json'):
+            raise CommandError('Specify --format csv or json')
+
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.user = self.get_user(options['user'])
+        self.imported = 0
+        self.errors = 0
+        self.load_lookups()
+
+        batch = []
+        for (line, row) in enumerate(self.read_rows(path, fmt), start=1):
+            try:
+                batch.append(self.parse_row(row))
+            except RowError as e:
+                self.errors += 1
+                self.stderr.write('Row {}: {}'.format(line, e))
+
+            if len(batch) >= options['batch_size']:
+                self.flush(batch)
+                batch = []
+
+        self.flush(batch)
+
+        if self.imported and not self.dry_run:
+            # bulk writes skip the receivers that expire cached data
+            for name in ('map', 'corpus', 'page.sites'):
+                bump_cache_version(name)
+            tile_cache.clear()
+
+        self.stdout.write('{} {} sites, skipped {} rows'.format(
+            'Would import' if self.dry_run else 'Imported',
+            self.imported, self.errors))
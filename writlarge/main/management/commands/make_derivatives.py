@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from writlarge.main.models import DigitalObject
+
+
+class Command(BaseCommand):
+    help = ('Render thumbnail & display copies of uploaded photos that '
+            'do not have them yet')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='re-render every uploaded photo')
+
+    def handle(self, *args, **options):
+        qs = DigitalObject.objects.exclude(file__isnull=True).exclude(file='')
+        if not options['all']:
+            qs = qs.exclude(derivatives_source=F('file'))
+
+        count = 0
+        for obj in qs.iterator(chunk_size=100):
+            obj.make_derivatives()
+            count += 1
+
+        self.stdout.write('Rendered {} photos'.format(count))
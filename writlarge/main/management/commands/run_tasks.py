@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from writlarge.main.tasks import purge_tasks, run_pending
+
+
+class Command(BaseCommand):
+    help = ('Run queued tasks, polling for new ones until stopped. '
+            'Pass --once to run whatever is due and exit, e.g. from cron.')
+
+    purge_interval = 60 * 60
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true')
+        parser.add_argument(
+            '--sleep', type=float, default=5,
+            help='seconds to wait when the queue is empty')
+        parser.add_argument(
+            '--purge-done-days', type=int,
+            help='hourly, delete tasks that finished this many days ago')
+
+    def purge(self, days):
+        count = purge_tasks(days)
+        if count and self.verbosity > 1:
+            self.stdout.write('Purged {} tasks'.format(count))
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        days = options['purge_done_days']
+        purged_at = None
+
+        while True:
+            if days is not None and (
+                    purged_at is None or
+                    time.monotonic() - purged_at >= self.purge_interval):
+                self.purge(days)
+                purged_at = time.monotonic()
+
+            count = run_pending()
+
+            if options['once'] or (count and self.verbosity > 1):
+                self.stdout.write('Ran {} tasks'.format(count))
+
+            if options['once']:
+                return
+
+            if not count:
+                # drop a connection the database closed while we slept
+                time.sleep(options['sleep'])
+                close_old_connections()
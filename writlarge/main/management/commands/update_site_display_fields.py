@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from writlarge.main.models import LearningSite
+
+
+class Command(BaseCommand):
+    help = ('Recompute the denormalized display fields & search vector '
+            'on every LearningSite')
+
+    def handle(self, *args, **options):
+        qs = LearningSite.objects.all().select_related(
+            'established', 'defunct').prefetch_related('category', 'tags')
+
+        for site in qs.iterator(chunk_size=500):
+            fields = site.compute_date_fields()
+            fields.update(site.compute_category_fields())
+            site.update_display_fields(fields)
+            site.update_search_vector()
+
+        self.stdout.write('Updated {} sites'.format(qs.count()))
@@ -1,11 +1,36 @@
 """
 Add user created_by and modified_by foreign key refs to any model
-automatically. Almost entirely taken from
+automatically. Originally taken from
 https://github.com/Atomidata/django-audit-log/
     blob/master/audit_log/middleware.py
+The acting user now lives in a context variable read by a single,
+permanently connected pre_save receiver.
 """
+from contextvars import ContextVar
+
 from django.db.models import signals
-from functools import partial as curry
+from django.utils.functional import SimpleLazyObject
+
+from writlarge.main.utils import get_editor_status
+
+
+# unset outside of write requests, None for anonymous writes
+_whodid_user = ContextVar('writlarge_whodid_user')
+_UNSET = object()
+
+
+def mark_whodid(sender, instance, **kwargs):
+    user = _whodid_user.get(_UNSET)
+    if user is _UNSET:
+        return
+
+    if not getattr(instance, 'created_by_id', None):
+        instance.created_by = user
+    if hasattr(instance, 'modified_by_id'):
+        instance.modified_by = user
+
+
+signals.pre_save.connect(mark_whodid, dispatch_uid='writlarge.whodid')
 
 
 class WhodidMiddleware(object):
@@ -14,26 +39,30 @@ class WhodidMiddleware(object):
         self.get_response = get_response
 
     def __call__(self, request):
-        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
-            if hasattr(request, 'user') and request.user.is_authenticated:
-                user = request.user
-            else:
-                user = None
+        if request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            return self.get_response(request)
+
+        if hasattr(request, 'user') and request.user.is_authenticated:
+            user = request.user
+        else:
+            user = None
 
-            mark_whodid = curry(self.mark_whodid, user)
-            signals.pre_save.connect(
-                mark_whodid,
-                dispatch_uid=(self.__class__, request,),
-                weak=False)
+        token = _whodid_user.set(user)
+        try:
+            return self.get_response(request)
+        finally:
+            _whodid_user.reset(token)
 
-        response = self.get_response(request)
 
-        signals.pre_save.disconnect(dispatch_uid=(self.__class__, request,))
+class EditorMiddleware(object):
+    """
+    Attach a lazy request.is_editor, resolved at most once per request
+    """
 
-        return response
+    def __init__(self, get_response):
+        self.get_response = get_response
 
-    def mark_whodid(self, user, sender, instance, **kwargs):
-        if not getattr(instance, 'created_by_id', None):
-            instance.created_by = user
-        if hasattr(instance, 'modified_by_id'):
-            instance.modified_by = user
+    def __call__(self, request):
+        request.is_editor = SimpleLazyObject(
+            lambda: get_editor_status(request))
+        return self.get_response(request)
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+from writlarge.main.utils import ExtendedDateWrapper
+
+
+def set_internal_dates(apps, schema_editor):
+    # dates saved before 0032 never had their lower & upper bounds stored
+    ExtendedDate = apps.get_model('main', 'ExtendedDate')
+    qs = ExtendedDate.objects.filter(
+        lower__isnull=True, upper__isnull=True).exclude(
+        edtf_format='unknown')
+
+    for dt in qs:
+        (lower, upper) = ExtendedDateWrapper.create(dt.edtf_format)
+        try:
+            dt.lower = lower.start_date() if lower else None
+            dt.upper = upper.end_date() if upper else None
+        except AttributeError:
+            # open or invalid range endpoints have no concrete bound
+            pass
+        dt.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_auto_20180817_1039'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='extendeddate',
+            name='lower',
+            field=models.DateField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='extendeddate',
+            name='upper',
+            field=models.DateField(db_index=True, null=True),
+        ),
+        migrations.RunPython(set_internal_dates, migrations.RunPython.noop),
+    ]
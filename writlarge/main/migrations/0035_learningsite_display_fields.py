@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0034_extendeddate_bounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learningsite',
+            name='established_year',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='learningsite',
+            name='defunct_year',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='learningsite',
+            name='date_display',
+            field=models.TextField(default='? - ?', editable=False),
+        ),
+        migrations.AddField(
+            model_name='learningsite',
+            name='site_group',
+            field=models.TextField(default='other', editable=False),
+        ),
+        migrations.AddField(
+            model_name='learningsite',
+            name='is_empty',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+    ]
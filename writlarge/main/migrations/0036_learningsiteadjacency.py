@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mirror_relationships(apps, schema_editor):
+    LearningSiteRelationship = apps.get_model(
+        'main', 'LearningSiteRelationship')
+    LearningSiteAdjacency = apps.get_model('main', 'LearningSiteAdjacency')
+
+    adjacencies = []
+    for r in LearningSiteRelationship.objects.all():
+        pairs = {(r.site_one_id, r.site_two_id),
+                 (r.site_two_id, r.site_one_id)}
+        adjacencies.extend([
+            LearningSiteAdjacency(
+                relationship=r, site_id=site, associate_id=other)
+            for (site, other) in pairs])
+
+    LearningSiteAdjacency.objects.bulk_create(adjacencies)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0035_learningsite_display_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LearningSiteAdjacency',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('associate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='associated_by', to='main.learningsite')),
+                ('relationship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.learningsiterelationship')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjacencies', to='main.learningsite')),
+            ],
+        ),
+        migrations.RunPython(mirror_relationships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX main_learningsite_search_vector_gin '
+            'ON main_learningsite USING gin (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS main_learningsite_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0036_learningsiteadjacency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learningsite',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+INDEXES = [
+    ('main_learningsite_title_trgm', 'main_learningsite', 'title'),
+    ('main_archivalcollection_title_trgm', 'main_archivalcollection',
+     'collection_title'),
+    ('main_archivalrepository_title_trgm', 'main_archivalrepository',
+     'title'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for (name, table, column) in INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} USING gin ({} gin_trgm_ops)'.format(
+                name, table, column))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for (name, table, column) in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0037_learningsite_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
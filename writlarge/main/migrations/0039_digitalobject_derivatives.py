@@ -0,0 +1,70 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0038_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digitalobject',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='thumbnail',
+            field=models.FileField(
+                editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='thumbnail_webp',
+            field=models.FileField(
+                editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='thumbnail_width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='thumbnail_height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='display',
+            field=models.FileField(
+                editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='display_webp',
+            field=models.FileField(
+                editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='display_width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='display_height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='digitalobject',
+            name='derivatives_source',
+            field=models.TextField(default='', editable=False),
+        ),
+    ]
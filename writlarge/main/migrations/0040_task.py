@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0039_digitalobject_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False,
+                    verbose_name='ID')),
+                ('name', models.TextField()),
+                ('args', models.JSONField(default=list)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('status', models.CharField(
+                    choices=[('queued', 'Queued'), ('running', 'Running'),
+                             ('done', 'Done'), ('failed', 'Failed')],
+                    default='queued', max_length=8)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_at', models.DateTimeField(
+                    default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['run_at'],
+                'indexes': [models.Index(
+                    fields=['status', 'run_at'],
+                    name='main_task_due_idx')],
+            },
+        ),
+    ]
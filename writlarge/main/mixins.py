@@ -1,17 +1,32 @@
 import collections
+from datetime import date
+import hashlib
 import json
+from math import cos, radians
 import re
 
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db.models.aggregates import Count, Max
+from django.db.models.expressions import F
 from django.db.models.query_utils import Q
 from django.forms.models import modelform_factory
+from django.middleware.csrf import get_token
 from django.http.response import HttpResponseNotAllowed, HttpResponse, \
     HttpResponseRedirect
 from django.urls.base import reverse
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.utils.html import escape
-from writlarge.main.models import LearningSite
-from writlarge.main.utils import sanitize
+from writlarge.main.models import SEARCH_CONFIG, LearningSite
+from writlarge.main.utils import (
+    get_cache_version, is_postgresql, request_is_editor, sanitize,
+    validate_integer)
 
 
 def is_ajax(request):
@@ -77,13 +92,77 @@ class LoggedInEditorMixin(object):
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
 
-        if (not self.request.user.groups or
-                not self.request.user.groups.filter(name='Editor').exists()):
+        if not request_is_editor(self.request):
             return HttpResponseRedirect('/accounts/login/')
 
         return super(LoggedInEditorMixin, self).dispatch(*args, **kwargs)
 
 
+class AnonymousCacheMixin(object):
+    """
+    Serve rendered GET responses to anonymous visitors from the cache.
+    Keys vary on the full path, including the query string, and on the
+    cache versions named by get_cache_versions, which model receivers
+    bump through utils.expire_pages. The page's csrf token is swapped
+    for the visitor's own on the way out.
+    """
+    cache_timeout = 60 * 15
+
+    def get_cache_versions(self):
+        return []
+
+    def get_response_cache_key(self):
+        versions = [str(get_cache_version(name))
+                    for name in self.get_cache_versions()]
+        path = hashlib.sha256(
+            self.request.get_full_path().encode('utf-8')).hexdigest()
+        return 'writlarge.page.{}.{}.{}'.format(
+            self.__class__.__name__, '.'.join(versions), path)
+
+    def is_cacheable(self, request):
+        # pending messages belong to this visitor alone
+        return (request.method == 'GET' and
+                request.user.is_anonymous and
+                len(messages.get_messages(request)) == 0)
+
+    def cache_response(self, key, response):
+        # pin the token rendered into the page so it can be found later
+        token = get_token(self.request)
+        response.context_data['csrf_token'] = token
+
+        def store(response):
+            cache.set(key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'token': token
+            }, self.cache_timeout)
+
+        response.add_post_render_callback(store)
+
+    def cached_response(self, cached):
+        token = get_token(self.request)
+        content = cached['content'].replace(
+            cached['token'].encode('utf-8'), token.encode('utf-8'))
+        return HttpResponse(content, content_type=cached['content_type'])
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super(AnonymousCacheMixin, self).dispatch(
+                request, *args, **kwargs)
+
+        key = self.get_response_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            return self.cached_response(cached)
+
+        response = super(AnonymousCacheMixin, self).dispatch(
+            request, *args, **kwargs)
+        if (response.status_code == 200 and
+                hasattr(response, 'add_post_render_callback')):
+            self.cache_response(key, response)
+        return response
+
+
 class SingleObjectCreatorMixin(object):
 
     def dispatch(self, *args, **kwargs):
@@ -99,6 +178,11 @@ SearchToken = collections.namedtuple('Token', ['typ', 'value'])
 
 
 class LearningSiteSearchMixin(object):
+    facet_lookups = {
+        'category': 'category__id__in',
+        'level': 'instructional_level__id__in',
+        'audience': 'target_audience__id__in',
+    }
 
     def _tokenize(self, q):
         specification = [
@@ -127,7 +211,8 @@ class LearningSiteSearchMixin(object):
                 yield SearchToken(kind, value[4:].strip())
 
     def _process_query(self, qs, q, full_search=False):
-        qs = qs.prefetch_related('category', 'tags')
+        full_text = full_search and is_postgresql()
+        terms = []
 
         for token in self._tokenize(q):
             value = sanitize(token.value)
@@ -135,6 +220,8 @@ class LearningSiteSearchMixin(object):
                 qs = qs.filter(category__name=value)
             elif token.typ == 'TAG':
                 qs = qs.filter(tags__name__in=[value])
+            elif token.typ == 'STRING' and full_text:
+                terms.append(value)
             elif token.typ == 'STRING' and full_search:
                 qs = qs.filter(
                     Q(title__icontains=value) |
@@ -143,22 +230,88 @@ class LearningSiteSearchMixin(object):
             elif token.typ == 'STRING':
                 qs = qs.filter(title__icontains=value)
 
+        if terms:
+            qs = self._process_full_text(qs, terms)
+
         return qs
 
-    def _process_years(self, qs, start, end):
-        qs = qs.prefetch_related('established', 'defunct')
+    def _process_full_text(self, qs, terms):
+        # each term, or quoted phrase, must match the stored search vector
+        query = None
+        for term in terms:
+            q = SearchQuery(term, search_type='phrase', config=SEARCH_CONFIG)
+            query = q if query is None else query & q
 
-        ids = []
-        for site in qs:
-            (min_year, max_year) = site.get_year_range()
-            if not min_year or not max_year:
-                ids.append(site.id)
-            elif min_year and (min_year > end):
-                ids.append(site.id)
-            elif max_year and (max_year < start):
-                ids.append(site.id)
+        return qs.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query))
 
-        return qs.exclude(id__in=ids)
+    def _process_years(self, qs, start, end):
+        # Mirrors LearningSite.get_year_range using the lower bounds stored
+        # on each ExtendedDate, so the range is filtered in the database
+        first_day = date(start, 1, 1)
+        last_day = date(end, 12, 31)
+        this_year = date.today().year
+
+        # the site's defunct year falls before the end of the range
+        defunct_before = Q(is_defunct=True, defunct__lower__lte=last_day)
+        if this_year <= end:
+            defunct_before |= Q(is_defunct=False)
+
+        # the site's defunct year falls after the start of the range
+        defunct_after = Q(is_defunct=True, defunct__lower__gte=first_day)
+        if this_year >= start:
+            defunct_after |= Q(is_defunct=False)
+
+        # a missing year falls back on the other
+        no_established = Q(established__lower__isnull=True)
+        no_defunct = Q(is_defunct=True, defunct__lower__isnull=True)
+
+        starts_before = (Q(established__lower__lte=last_day) |
+                         (no_established & defunct_before))
+        ends_after = (defunct_after |
+                      (no_defunct & Q(established__lower__gte=first_day)))
+
+        return qs.filter(starts_before & ends_after)
+
+    def _integer_list(self, param):
+        values = [validate_integer(v) for v in self.request.GET.getlist(param)]
+        return [v for v in values if v != '']
+
+    def _string_list(self, param):
+        values = [sanitize(v) for v in self.request.GET.getlist(param)]
+        return [v for v in values if v]
+
+    def _process_decades(self, qs, decades):
+        established = Q()
+        for decade in decades:
+            established |= Q(established_year__gte=decade,
+                             established_year__lt=decade + 10)
+        return qs.filter(established)
+
+    def _process_facets(self, qs):
+        # values within a facet are or'd together, facets are and'd
+        for param, lookup in self.facet_lookups.items():
+            ids = self._integer_list(param)
+            if ids:
+                qs = qs.filter(**{lookup: ids})
+
+        groups = self._string_list('group')
+        if groups:
+            qs = qs.filter(site_group__in=groups)
+
+        tags = self._string_list('tag')
+        if tags:
+            qs = qs.filter(tags__slug__in=tags)
+
+        decades = self._integer_list('decade')
+        if decades:
+            qs = self._process_decades(qs, decades)
+
+        verified = self.request.GET.get('verified', '').lower()
+        if verified in ('true', 'false'):
+            qs = qs.filter(verified=(verified == 'true'))
+
+        return qs
 
     def filter(self, qs, full_search=False):
         # filter out "empty" sites for anonymous users
@@ -173,12 +326,152 @@ class LearningSiteSearchMixin(object):
         # filter by start and end year
         start_year = self.request.GET.get('start', '')
         end_year = self.request.GET.get('end', '')
-        if (re.match(r'[1-2][0-9]{3}', start_year) and
-                re.match(r'[1-2][0-9]{3}', end_year)):
+        if (re.fullmatch(r'[1-2][0-9]{3}', start_year) and
+                re.fullmatch(r'[1-2][0-9]{3}', end_year)):
             qs = self._process_years(qs, int(start_year), int(end_year))
 
+        # filter by category, group, level, audience, tag, decade & verified
+        qs = self._process_facets(qs)
+
+        ordering = ['title']
+        if 'rank' in qs.query.annotations:
+            ordering = ['-rank', 'title']
+
         return qs.distinct().select_related(
             'established', 'defunct',
             'created_by', 'modified_by').prefetch_related(
-            'place', 'category', 'digital_object',
-            'site_one', 'site_two', 'tags').order_by('title')
+            'place', 'category', 'digital_object', 'tags').order_by(*ordering)
+
+
+class SpatialFilterMixin(object):
+    """
+    Restrict a queryset to points inside bbox=west,south,east,north
+    or within radius meters of near=lat,lng
+    """
+    METERS_PER_DEGREE = 111320.0
+
+    def _parse_floats(self, param, count):
+        value = self.request.GET.get(param, '')
+        try:
+            values = [float(v) for v in value.split(',')]
+        except ValueError:
+            return None
+        return values if len(values) == count else None
+
+    def _valid_point(self, lng, lat):
+        return -180 <= lng <= 180 and -90 <= lat <= 90
+
+    def _bbox(self, west, south, east, north):
+        poly = Polygon.from_bbox((west, south, east, north))
+        poly.srid = 4326
+        return poly
+
+    def filter_bbox(self, qs, field):
+        bbox = self._parse_floats('bbox', 4)
+        if bbox is None:
+            return qs
+
+        (west, south, east, north) = bbox
+        if not (self._valid_point(west, south) and
+                self._valid_point(east, north) and
+                west < east and south < north):
+            return qs
+
+        within = '{}__within'.format(field)
+        return qs.filter(**{within: self._bbox(west, south, east, north)})
+
+    def filter_near(self, qs, field):
+        near = self._parse_floats('near', 2)
+        radius = self._parse_floats('radius', 1)
+        if near is None or radius is None:
+            return qs
+
+        (lat, lng) = near
+        radius = radius[0]
+        if not (self._valid_point(lng, lat) and radius > 0):
+            return qs
+
+        # narrow with an indexed bounding box, then check the true distance
+        dlat = radius / self.METERS_PER_DEGREE
+        dlng = dlat / max(cos(radians(lat)), 0.01)
+        box = self._bbox(max(lng - dlng, -180), max(lat - dlat, -90),
+                         min(lng + dlng, 180), min(lat + dlat, 90))
+
+        point = Point(lng, lat, srid=4326)
+        return qs.filter(**{
+            '{}__within'.format(field): box,
+            '{}__distance_lte'.format(field): (point, D(m=radius))
+        })
+
+    def filter_spatial(self, qs, field):
+        qs = self.filter_bbox(qs, field)
+        return self.filter_near(qs, field)
+
+
+class ConditionalResponseMixin(object):
+    """
+    ETag and Last-Modified validators for DRF list & retrieve actions,
+    computed from one aggregate over the filtered queryset. The aggregate
+    covers the objects' own modified_at, their count, and any related
+    timestamps or counts named in etag_aggregates. Cache versions in
+    etag_versions fold in changes that leave no timestamp behind.
+    Lists send no Last-Modified, deletions & m2m changes would not
+    move it forward.
+    """
+    etag_aggregates = {}
+    etag_versions = ()
+
+    def get_validator_queryset(self):
+        qs = self.filter_queryset(self.get_queryset())
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            qs = qs.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return qs
+
+    def get_validators(self):
+        values = self.get_validator_queryset().order_by().aggregate(
+            modified_at=Max('modified_at'),
+            count=Count('pk', distinct=True),
+            **self.etag_aggregates)
+
+        timestamps = [value for value in values.values()
+                      if hasattr(value, 'timestamp')]
+        last_modified = max(timestamps) if timestamps else None
+
+        versions = [get_cache_version(name) for name in self.etag_versions]
+        key = '{}|{}|{}|{}'.format(
+            sorted(values.items()), versions,
+            self.request.user.is_anonymous, self.request.get_full_path())
+        etag = quote_etag(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+        return (etag, last_modified)
+
+    def conditional(self, action, request, *args,
+                    send_last_modified=True, **kwargs):
+        (etag, last_modified) = self.get_validators()
+        timestamp = None
+        if last_modified and send_last_modified:
+            timestamp = int(last_modified.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = action(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            super(ConditionalResponseMixin, self).list,
+            request, *args, send_last_modified=False, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            super(ConditionalResponseMixin, self).retrieve,
+            request, *args, **kwargs)
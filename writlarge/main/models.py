@@ -1,15 +1,31 @@
 from datetime import date
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.gis.db.models.fields import PointField
 from django.contrib.gis.geos.point import Point
-from django.db import models
+from django.core.files.base import ContentFile
+from django.db import models, transaction
 from django.db.models.aggregates import Count
+from django.db.models.expressions import F, Value
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.query_utils import Q
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
 from django.urls.base import reverse
+from django.utils import timezone
 from edtf import text_to_edtf
 from taggit.managers import TaggableManager
 
-from writlarge.main.utils import ExtendedDateWrapper, format_date_range
+from writlarge.main.images import make_derivatives
+from writlarge.main.utils import (
+    ExtendedDateWrapper, bump_cache_version, bump_on_commit,
+    editor_version_name, expire_pages, format_date_range, is_postgresql,
+    tile_cache, year_range)
+
+
+SEARCH_CONFIG = 'english'
 
 
 class ExtendedDateManager(models.Manager):
@@ -63,6 +79,11 @@ class ExtendedDateManager(models.Manager):
 
         return ExtendedDate(edtf_format=dt)
 
+    def from_string(self, date_str):
+        # an unsaved date, or None if the text can't be understood
+        edtf = text_to_edtf(date_str)
+        return ExtendedDate(edtf_format=str(edtf)) if edtf else None
+
     def create_from_string(self, date_str):
         edtf = str(text_to_edtf(date_str))
         return ExtendedDate.objects.create(edtf_format=edtf)
@@ -71,8 +92,8 @@ class ExtendedDateManager(models.Manager):
 class ExtendedDate(models.Model):
     objects = ExtendedDateManager()
     edtf_format = models.CharField(max_length=256)
-    lower = models.DateField(null=True)
-    upper = models.DateField(null=True)
+    lower = models.DateField(null=True, db_index=True)
+    upper = models.DateField(null=True, db_index=True)
 
     class Meta:
         verbose_name = 'Extended Date Format'
@@ -153,9 +174,32 @@ class DigitalObject(models.Model):
         null=True, blank=True,
         help_text="Where did you find this photo?")
 
+    # resized copies of an uploaded photo, see writlarge.main.images
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    thumbnail = models.FileField(
+        null=True, max_length=255, editable=False)
+    thumbnail_webp = models.FileField(
+        null=True, max_length=255, editable=False)
+    thumbnail_width = models.PositiveIntegerField(null=True, editable=False)
+    thumbnail_height = models.PositiveIntegerField(null=True, editable=False)
+    display = models.FileField(
+        null=True, max_length=255, editable=False)
+    display_webp = models.FileField(
+        null=True, max_length=255, editable=False)
+    display_width = models.PositiveIntegerField(null=True, editable=False)
+    display_height = models.PositiveIntegerField(null=True, editable=False)
+    derivatives_source = models.TextField(default='', editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    derivative_fields = (
+        'thumbnail', 'thumbnail_webp', 'display', 'display_webp')
+    dimension_fields = (
+        'width', 'height', 'thumbnail_width', 'thumbnail_height',
+        'display_width', 'display_height')
+
     class Meta:
         verbose_name = "Digital Object"
         ordering = ['-created_at']
@@ -169,6 +213,56 @@ class DigitalObject(models.Model):
         else:
             return self.source_url
 
+    def thumbnail_url(self):
+        return self.thumbnail.url if self.thumbnail else self.get_url()
+
+    def display_url(self):
+        return self.display.url if self.display else self.get_url()
+
+    def delete_derivatives(self):
+        files = [(getattr(self, field).storage, getattr(self, field).name)
+                 for field in self.derivative_fields if getattr(self, field)]
+
+        def delete_files():
+            for (storage, name) in files:
+                storage.delete(name)
+
+        # only once the row stops pointing at them, a rollback keeps them
+        transaction.on_commit(delete_files)
+
+    def make_derivatives(self):
+        """
+        Store web-sized jpeg & webp copies of an uploaded photo along
+        with their dimensions. Photos linked by source_url are skipped.
+        """
+        values = dict.fromkeys(
+            self.derivative_fields + self.dimension_fields)
+        values['derivatives_source'] = self.file.name or ''
+
+        result = None
+        if self.file:
+            with self.file.open('rb') as f:
+                result = make_derivatives(f)
+
+        if result is not None:
+            ((values['width'], values['height']), derivatives) = result
+            for d in derivatives:
+                field = d.name if d.ext == 'jpg' else d.name + '_' + d.ext
+                values[field] = self.file.storage.save(
+                    d.filename(self.file.name), ContentFile(d.content))
+                values[d.name + '_width'] = d.width
+                values[d.name + '_height'] = d.height
+
+        # an update rather than a save, so a concurrent edit is not
+        # overwritten, but the site pages & ETags still see the change
+        values['modified_at'] = timezone.now()
+
+        self.delete_derivatives()
+        for (field, value) in values.items():
+            setattr(self, field, value)
+        DigitalObject.objects.filter(pk=self.pk).update(**values)
+        expire_pages(sites=self.learningsite_set.values_list('id', flat=True))
+
 
 class LearningSiteCategory(models.Model):
     name = models.TextField(unique=True)
@@ -308,6 +402,16 @@ class LearningSite(models.Model):
     verified = models.BooleanField(default=False)
     verified_modified_at = models.DateTimeField(null=True, blank=True)
 
+    # denormalized display fields, kept current by the receivers below
+    established_year = models.IntegerField(null=True, editable=False)
+    defunct_year = models.IntegerField(null=True, editable=False)
+    date_display = models.TextField(default='? - ?', editable=False)
+    site_group = models.TextField(default='other', editable=False)
+    is_empty = models.BooleanField(default=True, editable=False)
+
+    # full text search over the site, its categories & tags
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
@@ -328,8 +432,70 @@ class LearningSite(models.Model):
     def get_absolute_url(self):
         return reverse('site-detail-view', kwargs={'pk': self.id})
 
+    def save(self, *args, **kwargs):
+        for key, value in self.compute_date_fields().items():
+            setattr(self, key, value)
+        super(LearningSite, self).save(*args, **kwargs)
+
+    def compute_date_fields(self):
+        est = self.established.get_year() if self.established else None
+        defunct = self.defunct.get_year() if self.defunct else None
+        return {
+            'established_year': est,
+            'defunct_year': defunct,
+            'date_display': format_date_range(
+                self.established, self.is_defunct, self.defunct)
+        }
+
+    def compute_category_fields(self):
+        category = self.category.first()
+        return {
+            'site_group': category.group if category else 'other',
+            'is_empty': category is None
+        }
+
+    @staticmethod
+    def search_vector_expression(names):
+        """
+        The search_vector expression for an update, given an expression
+        holding the site's category & tag names
+        """
+        people = Concat(
+            names, Value(' '), Coalesce('founder', Value('')), Value(' '),
+            Coalesce('corporate_body', Value('')),
+            output_field=models.TextField())
+        text = Concat(
+            Coalesce('description', Value('')), Value(' '),
+            Coalesce('notes', Value('')), output_field=models.TextField())
+
+        return (
+            SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector(people, weight='B', config=SEARCH_CONFIG) +
+            SearchVector(text, weight='C', config=SEARCH_CONFIG))
+
+    def update_search_vector(self):
+        if not is_postgresql():
+            return
+
+        names = [category.name for category in self.category.all()]
+        names.extend(self.tags_display())
+
+        vector = self.search_vector_expression(Value(' '.join(names)))
+        LearningSite.objects.filter(pk=self.pk).update(search_vector=vector)
+
+    def update_display_fields(self, fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+        LearningSite.objects.filter(pk=self.pk).update(**fields)
+        self.purge_tiles()
+
+    def purge_tiles(self, places=None):
+        if places is None:
+            places = self.place.all()
+        tile_cache.purge_on_commit([place.latlng for place in places])
+
     def empty(self):
-        return self.category.count() < 1
+        return self.is_empty
 
     def sort_date(self):
         if self.established:
@@ -340,39 +506,22 @@ class LearningSite(models.Model):
         return date.min
 
     def associates(self):
-        lst = LearningSiteRelationship.objects.filter(
-            site_one=self).values_list('site_two__id', flat=True)
-        lst2 = LearningSiteRelationship.objects.filter(
-            site_two=self).values_list('site_one__id', flat=True)
-        ids = lst.union(lst2)
-        return LearningSite.objects.filter(id__in=ids)
+        return LearningSite.objects.filter(
+            associated_by__site=self).distinct()
 
     def has_connections(self):
-        return self.associates().exists()
+        return self.adjacencies.exists()
 
     def connections(self):
-        return [site.id for site in self.associates()]
+        return list(self.adjacencies.values_list(
+            'associate__id', flat=True).distinct())
 
     def group(self):
-        category = self.category.first()
-        return category.group if category else 'other'
+        return self.site_group
 
     def get_year_range(self):
-        est = self.established.get_year() if self.established else None
-
-        if not self.is_defunct:
-            defunct = date.today().year
-        else:
-            defunct = self.defunct.get_year() if self.defunct else None
-
-        if est and defunct:
-            return (est, defunct)
-        elif est:
-            return (est, est)
-        elif defunct:
-            return (defunct, defunct)
-        else:
-            return (None, None)
+        return year_range(
+            self.established_year, self.is_defunct, self.defunct_year)
 
     def places_by_start_date(self):
         # Sort places by start_date desc, but sort empty dates to the end
@@ -381,10 +530,10 @@ class LearningSite(models.Model):
                 '-empty_start_date', '-start_date__lower', 'title')
 
     def established_defunct_display(self):
-        return format_date_range(
-            self.established, self.is_defunct, self.defunct)
+        return self.date_display
 
     def tags_display(self):
+        # all() reads from the prefetch cache when tags were prefetched
         return [tag.name for tag in self.tags.all()]
 
 
@@ -395,6 +544,68 @@ class LearningSiteRelationship(models.Model):
         LearningSite, related_name='site_two', on_delete=models.CASCADE)
 
 
+class LearningSiteAdjacency(models.Model):
+    """
+    Each LearningSiteRelationship mirrored in both directions, so a site's
+    associates are a single indexed lookup on site.
+    """
+    relationship = models.ForeignKey(
+        LearningSiteRelationship, on_delete=models.CASCADE)
+    site = models.ForeignKey(
+        LearningSite, related_name='adjacencies', on_delete=models.CASCADE)
+    associate = models.ForeignKey(
+        LearningSite, related_name='associated_by',
+        on_delete=models.CASCADE)
+
+    @classmethod
+    def neighbourhood(cls, site_id, depth, max_nodes):
+        """
+        Breadth-first walk out to depth hops from site_id, one query per hop.
+        Returns ({site_id: hops}, {(lower_id, higher_id)}, truncated)
+        """
+        hops = {site_id: 0}
+        edges = set()
+        truncated = False
+
+        frontier = {site_id}
+        for hop in range(1, depth + 1):
+            rows = cls.objects.filter(site__id__in=frontier).values_list(
+                'site__id', 'associate__id')
+
+            frontier = set()
+            for (site, associate) in rows:
+                if associate not in hops:
+                    if len(hops) >= max_nodes:
+                        truncated = True
+                        continue
+                    hops[associate] = hop
+                    frontier.add(associate)
+                edges.add((min(site, associate), max(site, associate)))
+
+            if not frontier:
+                break
+
+        if frontier:
+            # connections among the outermost sites
+            rows = cls.objects.filter(
+                site__id__in=frontier, associate__id__in=frontier)
+            for (site, associate) in rows.values_list(
+                    'site__id', 'associate__id'):
+                edges.add((min(site, associate), max(site, associate)))
+
+        return hops, edges, truncated
+
+    @classmethod
+    def mirror(cls, relationship):
+        cls.objects.filter(relationship=relationship).delete()
+
+        pairs = {(relationship.site_one_id, relationship.site_two_id),
+                 (relationship.site_two_id, relationship.site_one_id)}
+        cls.objects.bulk_create([
+            cls(relationship=relationship, site_id=site, associate_id=other)
+            for (site, other) in pairs])
+
+
 class ArchivalRepository(models.Model):
     title = models.TextField(unique=True, verbose_name="Repository Title")
 
@@ -546,3 +757,356 @@ class ArchivalCollectionSuggestion(models.Model):
         self.save()
 
         return collection
+
+
+class TaskManager(models.Manager):
+
+    def enqueue(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) for the run_tasks worker. func is a
+        function marked with writlarge.main.tasks.task, or its dotted
+        path. Arguments must be JSON serializable.
+        """
+        if not isinstance(func, str):
+            func = '{}.{}'.format(func.__module__, func.__name__)
+        return self.create(name=func, args=list(args), kwargs=kwargs)
+
+    def abandoned(self, now, timeout):
+        # running tasks whose lease lapsed belong to a dead worker
+        return self.filter(
+            status=Task.RUNNING, modified_at__lt=now - timeout)
+
+    def due(self, now, timeout):
+        retry = self.abandoned(now, timeout).filter(
+            attempts__lt=F('max_attempts'))
+        return (self.filter(status=Task.QUEUED, run_at__lte=now) | retry
+                ).order_by('run_at', 'id')
+
+
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    objects = TaskManager()
+
+    name = models.TextField()
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+
+    status = models.CharField(
+        max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [models.Index(
+            fields=['status', 'run_at'], name='main_task_due_idx')]
+
+    def __str__(self):
+        return '{} ({})'.format(self.name, self.status)
+
+
+@receiver(post_save, sender=LearningSite)
+def site_saved(sender, instance, **kwargs):
+    instance.update_search_vector()
+
+
+@receiver(m2m_changed, sender=LearningSite.tags.through)
+def site_tags_changed(sender, instance, action, reverse, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.update_search_vector()
+
+
+@receiver(post_save, sender=LearningSiteRelationship)
+def relationship_saved(sender, instance, **kwargs):
+    # deleted relationships cascade to their adjacencies
+    LearningSiteAdjacency.mirror(instance)
+
+
+@receiver(post_save, sender=ExtendedDate)
+def extended_date_saved(sender, instance, **kwargs):
+    sites = LearningSite.objects.filter(
+        Q(established=instance) | Q(defunct=instance)).select_related(
+        'established', 'defunct')
+    for site in sites:
+        site.update_display_fields(site.compute_date_fields())
+
+
+@receiver(pre_delete, sender=ExtendedDate)
+def extended_date_deleting(sender, instance, **kwargs):
+    # SET_NULL clears the references before post_delete runs
+    instance._site_ids = list(LearningSite.objects.filter(
+        Q(established=instance) | Q(defunct=instance)).values_list(
+        'id', flat=True))
+
+
+@receiver(post_delete, sender=ExtendedDate)
+def extended_date_deleted(sender, instance, **kwargs):
+    site_ids = getattr(instance, '_site_ids', [])
+    sites = LearningSite.objects.filter(id__in=site_ids).select_related(
+        'established', 'defunct')
+    for site in sites:
+        site.update_display_fields(site.compute_date_fields())
+
+    if site_ids:
+        bump_on_commit('corpus')
+        expire_pages(sites=site_page_ids(site_ids))
+
+
+@receiver(m2m_changed, sender=LearningSite.category.through)
+def site_category_changed(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    if reverse and action == 'pre_clear':
+        # the cleared sites can't be looked up after the fact
+        instance._cleared_site_ids = list(
+            instance.learningsite_set.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        sites = [instance]
+    elif action == 'post_clear':
+        sites = LearningSite.objects.filter(
+            id__in=instance._cleared_site_ids)
+    else:
+        sites = LearningSite.objects.filter(id__in=pk_set)
+
+    for site in sites:
+        site.update_display_fields(site.compute_category_fields())
+        site.update_search_vector()
+
+
+@receiver(post_save, sender=LearningSiteCategory)
+def site_category_saved(sender, instance, created, **kwargs):
+    if not created:
+        for site in instance.learningsite_set.all():
+            site.update_display_fields(site.compute_category_fields())
+            site.update_search_vector()
+
+
+@receiver(pre_delete, sender=LearningSiteCategory)
+def site_category_deleting(sender, instance, **kwargs):
+    instance._deleted_site_ids = list(
+        instance.learningsite_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=LearningSiteCategory)
+def site_category_deleted(sender, instance, **kwargs):
+    sites = LearningSite.objects.filter(id__in=instance._deleted_site_ids)
+    for site in sites:
+        site.update_display_fields(site.compute_category_fields())
+        site.update_search_vector()
+
+
+@receiver([post_save, post_delete], sender=Place)
+@receiver([post_save, post_delete], sender=LearningSite)
+@receiver([post_save, post_delete], sender=LearningSiteCategory)
+@receiver(m2m_changed, sender=LearningSite.place.through)
+@receiver(m2m_changed, sender=LearningSite.category.through)
+def map_changed(sender, **kwargs):
+    bump_on_commit('map')
+
+
+@receiver(pre_save, sender=Place)
+def place_moving(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        old = Place.objects.filter(pk=instance.pk).first()
+        if old and old.latlng != instance.latlng:
+            tile_cache.purge_on_commit([old.latlng])
+
+
+@receiver([post_save, post_delete], sender=Place)
+def place_tiles_changed(sender, instance, **kwargs):
+    tile_cache.purge_on_commit([instance.latlng])
+
+
+@receiver(post_save, sender=LearningSite)
+def site_tiles_changed(sender, instance, created, **kwargs):
+    if not created:
+        instance.purge_tiles()
+
+
+@receiver(pre_delete, sender=LearningSite)
+def site_tiles_deleting(sender, instance, **kwargs):
+    instance.purge_tiles()
+
+
+@receiver(m2m_changed, sender=LearningSite.place.through)
+def site_places_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse:
+        if action.startswith('post_'):
+            tile_cache.purge_on_commit([instance.latlng])
+    elif action == 'pre_clear':
+        instance.purge_tiles()
+    elif action in ('post_add', 'post_remove'):
+        instance.purge_tiles(Place.objects.filter(id__in=pk_set))
+
+
+@receiver([post_save, post_delete], sender=LearningSite)
+@receiver([post_save, post_delete], sender=LearningSiteCategory)
+@receiver([post_save, post_delete], sender=InstructionalLevel)
+@receiver([post_save, post_delete], sender=Audience)
+@receiver(post_save, sender=ExtendedDate)
+@receiver(m2m_changed, sender=LearningSite.category.through)
+@receiver(m2m_changed, sender=LearningSite.instructional_level.through)
+@receiver(m2m_changed, sender=LearningSite.target_audience.through)
+@receiver(m2m_changed, sender=LearningSite.tags.through)
+def corpus_changed(sender, **kwargs):
+    bump_on_commit('corpus')
+
+
+# cached anonymous pages, see AnonymousCacheMixin
+
+def site_page_ids(site_ids):
+    return list(site_ids) + list(LearningSiteAdjacency.objects.filter(
+        site__id__in=site_ids).values_list('associate__id', flat=True))
+
+
+@receiver(post_save, sender=LearningSite)
+@receiver(pre_delete, sender=LearningSite)
+def site_page_changed(sender, instance, **kwargs):
+    expire_pages(
+        sites=site_page_ids([instance.pk]),
+        collections=instance.archivalcollection_set.values_list(
+            'id', flat=True))
+
+
+@receiver(m2m_changed, sender=LearningSite.place.through)
+@receiver(m2m_changed, sender=LearningSite.category.through)
+@receiver(m2m_changed, sender=LearningSite.instructional_level.through)
+@receiver(m2m_changed, sender=LearningSite.target_audience.through)
+@receiver(m2m_changed, sender=LearningSite.digital_object.through)
+@receiver(m2m_changed, sender=LearningSite.footnotes.through)
+@receiver(m2m_changed, sender=LearningSite.tags.through)
+def site_related_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if action.startswith('post_'):
+        expire_pages(sites=(pk_set or []) if reverse else [instance.pk])
+
+
+@receiver([post_save, pre_delete], sender=DigitalObject)
+@receiver([post_save, pre_delete], sender=Footnote)
+@receiver([post_save, pre_delete], sender=LearningSiteCategory)
+@receiver([post_save, pre_delete], sender=InstructionalLevel)
+@receiver([post_save, pre_delete], sender=Audience)
+def site_detail_changed(sender, instance, **kwargs):
+    expire_pages(sites=instance.learningsite_set.values_list('id', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=Place)
+def place_page_changed(sender, instance, **kwargs):
+    expire_pages(
+        sites=instance.learningsite_set.values_list('id', flat=True),
+        collections=ArchivalCollection.objects.filter(
+            repository__place=instance).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=LearningSiteRelationship)
+def relationship_page_changed(sender, instance, **kwargs):
+    expire_pages(sites=site_page_ids(
+        [instance.site_one_id, instance.site_two_id]))
+
+
+@receiver(post_save, sender=ArchivalCollection)
+@receiver(pre_delete, sender=ArchivalCollection)
+def collection_page_changed(sender, instance, **kwargs):
+    expire_pages(
+        sites=instance.learning_sites.values_list('id', flat=True),
+        collections=[instance.pk])
+
+
+@receiver(m2m_changed, sender=ArchivalCollection.learning_sites.through)
+@receiver(m2m_changed, sender=ArchivalCollection.record_format.through)
+def collection_related_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if reverse and sender == ArchivalCollection.learning_sites.through:
+        expire_pages(sites=[instance.pk], collections=pk_set or [])
+    elif reverse:
+        expire_pages(collections=pk_set or [])
+    elif sender == ArchivalCollection.learning_sites.through:
+        expire_pages(sites=pk_set or [], collections=[instance.pk])
+    else:
+        expire_pages(collections=[instance.pk])
+
+
+@receiver([post_save, pre_delete], sender=ArchivalRepository)
+def repository_page_changed(sender, instance, **kwargs):
+    expire_pages(collections=instance.archivalcollection_set.values_list(
+        'id', flat=True))
+
+
+@receiver(post_save, sender=ExtendedDate)
+def date_page_changed(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    expire_pages(
+        sites=LearningSite.objects.filter(
+            Q(established=instance) | Q(defunct=instance) |
+            Q(place__start_date=instance) | Q(place__end_date=instance) |
+            Q(digital_object__date_taken=instance)).values_list(
+            'id', flat=True),
+        collections=ArchivalCollection.objects.filter(
+            Q(inclusive_start=instance) |
+            Q(inclusive_end=instance)).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse and action == 'pre_clear':
+        # the cleared users can't be looked up after the fact
+        instance._cleared_user_ids = list(
+            instance.user_set.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = instance._cleared_user_ids
+    else:
+        user_ids = pk_set
+
+    for user_id in user_ids:
+        bump_cache_version(editor_version_name(user_id))
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    for user_id in instance.user_set.values_list('id', flat=True):
+        bump_cache_version(editor_version_name(user_id))
+
+
+@receiver(post_save, sender=DigitalObject)
+def digital_object_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.derivatives_source != (instance.file.name or ''):
+        Task.objects.enqueue(
+            'writlarge.main.tasks.make_derivatives', instance.pk)
+
+
+@receiver(post_delete, sender=DigitalObject)
+def digital_object_deleted(sender, instance, **kwargs):
+    instance.delete_derivatives()
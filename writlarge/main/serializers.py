@@ -2,13 +2,17 @@ from rest_framework import serializers
 
 from django.contrib.gis.geos import Point
 from writlarge.main.models import ArchivalRepository, LearningSite, \
-    LearningSiteCategory, DigitalObject, Place
+    LearningSiteAdjacency, LearningSiteCategory, DigitalObject, Place
+from writlarge.main.utils import validate_integer
 
 
 class DigitalObjectSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = DigitalObject
-        fields = ('id', 'file', 'description', 'source_url')
+        fields = ('id', 'file', 'description', 'source_url',
+                  'width', 'height', 'thumbnail', 'thumbnail_webp',
+                  'thumbnail_width', 'thumbnail_height', 'display',
+                  'display_webp', 'display_width', 'display_height')
 
 
 class LearningSiteCategorySerializer(serializers.HyperlinkedModelSerializer):
@@ -64,6 +68,12 @@ class LearningSiteSerializer(serializers.HyperlinkedModelSerializer):
     digital_object = DigitalObjectSerializer(read_only=True, many=True)
     place = PlaceSerializer(many=True)
 
+    # read from the stored display fields & the prefetched tags
+    empty = serializers.BooleanField(source='is_empty', read_only=True)
+    tags_display = serializers.ListField(read_only=True)
+    established_defunct_display = serializers.CharField(
+        source='date_display', read_only=True)
+
     class Meta:
         model = LearningSite
         fields = ('id', 'title', 'place', 'category',
@@ -86,13 +96,57 @@ class LearningSiteSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class LearningSiteFamilySerializer(serializers.HyperlinkedModelSerializer):
+    MAX_DEPTH = 4
+    MAX_NODES = 250
+
     id = serializers.IntegerField(read_only=True)
     category = LearningSiteCategorySerializer(read_only=True, many=True)
     family = serializers.SerializerMethodField(read_only=True)
+    network = serializers.SerializerMethodField(read_only=True)
+
+    def get_depth(self):
+        # the network costs a query per hop, so lists leave it out
+        request = self.context.get('request', None)
+        view = self.context.get('view', None)
+        if request is None or getattr(view, 'action', None) != 'retrieve':
+            return None
+
+        depth = validate_integer(request.GET.get('depth', ''))
+        if depth == '':
+            return None
+        return max(1, min(depth, self.MAX_DEPTH))
+
+    def get_network(self, obj):
+        depth = self.get_depth()
+        if depth is None:
+            return None
+
+        (hops, edges, truncated) = LearningSiteAdjacency.neighbourhood(
+            obj.id, depth, self.MAX_NODES)
+
+        sites = LearningSite.objects.filter(id__in=list(hops)).values(
+            'id', 'title', 'site_group')
+        nodes = [{
+            'id': site['id'],
+            'title': site['title'],
+            'group': site['site_group'],
+            'depth': hops[site['id']]
+        } for site in sites]
+
+        return {
+            'depth': depth,
+            'nodes': sorted(nodes, key=lambda n: (n['depth'], n['title'])),
+            'edges': sorted(edges),
+            'truncated': truncated
+        }
 
     def get_family(self, obj):
+        # adjacencies.all() reads from the prefetch cache when available
+        associates = {adjacency.associate_id: adjacency.associate
+                      for adjacency in obj.adjacencies.all()}
+
         family = []
-        for site in obj.associates():
+        for site in sorted(associates.values(), key=lambda s: s.title):
             family.append({
                 'id': site.id,
                 'title': site.title,
@@ -103,4 +157,4 @@ class LearningSiteFamilySerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = LearningSite
-        fields = ('id', 'title', 'category', 'family')
+        fields = ('id', 'title', 'category', 'family', 'network')
@@ -0,0 +1,109 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.aggregates import Count, Min
+from django.db.models.expressions import ExpressionWrapper, F
+from django.db.models.fields import IntegerField
+from django.db.models.query_utils import Q
+
+from writlarge.main.models import (
+    Audience, InstructionalLevel, LearningSite, LearningSiteCategory)
+from writlarge.main.utils import get_cache_version
+
+
+class CorpusStats(object):
+    """
+    Facet counts over a set of learning sites. Each facet is a single
+    grouped query, and the counts for the whole corpus are cached until
+    a site or one of its facets changes.
+    """
+    facets = ('category', 'group', 'tag', 'instructional_level',
+              'audience', 'decade')
+    cache_timeout = 60 * 60
+
+    def __init__(self, sites=None):
+        if sites is None:
+            self.sites = LearningSite.objects.all()
+        else:
+            # detach from any joins, annotations or ordering on the caller
+            self.sites = LearningSite.objects.filter(
+                id__in=sites.order_by().values('id'))
+
+    @classmethod
+    def for_corpus(cls, public=True):
+        key = 'writlarge.stats.{}.{}'.format(
+            get_cache_version('corpus'), 'public' if public else 'all')
+
+        stats = cache.get(key)
+        if stats is None:
+            sites = LearningSite.objects.all()
+            if public:
+                sites = sites.filter(is_empty=False)
+            stats = cls(sites).to_dict()
+            cache.set(key, stats, cls.cache_timeout)
+        return stats
+
+    def site_ids(self):
+        return self.sites.values('id')
+
+    def count_related(self, model):
+        rows = model.objects.filter(
+            learningsite__in=self.site_ids()).values('id', 'name').annotate(
+            count=Count('learningsite', distinct=True)).order_by('name')
+        return list(rows)
+
+    def category(self):
+        return self.count_related(LearningSiteCategory)
+
+    def instructional_level(self):
+        return self.count_related(InstructionalLevel)
+
+    def audience(self):
+        return self.count_related(Audience)
+
+    def group(self):
+        rows = self.sites.values('site_group').annotate(
+            count=Count('id', distinct=True)).order_by('site_group')
+        return [{'name': row['site_group'], 'count': row['count']}
+                for row in rows]
+
+    def tag(self):
+        through = LearningSite.tags.through
+        rows = through.objects.filter(
+            content_type=ContentType.objects.get_for_model(LearningSite),
+            object_id__in=self.site_ids()).values(
+            'tag__name', 'tag__slug').annotate(
+            count=Count('object_id', distinct=True)).order_by('tag__name')
+        return [{'name': row['tag__name'], 'slug': row['tag__slug'],
+                 'count': row['count']} for row in rows]
+
+    def decade(self):
+        decade = ExpressionWrapper(
+            F('established_year') / 10 * 10, output_field=IntegerField())
+        rows = self.sites.filter(established_year__isnull=False).annotate(
+            decade=decade).values('decade').annotate(
+            count=Count('id', distinct=True)).order_by('decade')
+        return list(rows)
+
+    def min_year(self):
+        # the aggregate form of min(site.get_year_range()[0])
+        undated = Q(established_year__isnull=True)
+        years = self.sites.aggregate(
+            established=Min('established_year'),
+            defunct=Min('defunct_year', filter=undated & Q(is_defunct=True)),
+            active=Count('id', filter=undated & Q(is_defunct=False)))
+
+        candidates = [years['established'], years['defunct']]
+        if years['active']:
+            candidates.append(datetime.date.today().year)
+
+        candidates = [year for year in candidates if year is not None]
+        return min(candidates) if candidates else None
+
+    def to_dict(self, min_year=True):
+        stats = {facet: getattr(self, facet)() for facet in self.facets}
+        stats['total'] = self.sites.count()
+        if min_year:
+            stats['min_year'] = self.min_year()
+        return stats
@@ -0,0 +1,144 @@
+"""
+Deferred work, run outside of the request by the run_tasks command.
+Queue a call with Task.objects.enqueue(func, *args, **kwargs). Failed
+calls are retried with exponential backoff up to Task.max_attempts.
+"""
+from datetime import timedelta
+import threading
+import traceback
+
+from django.conf import settings
+from django.core import mail
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from writlarge.main.models import DigitalObject, Task
+from writlarge.main.utils import is_postgresql
+
+
+def task(func):
+    """Mark func as safe for the worker to run"""
+    func.is_task = True
+    return func
+
+
+@task
+def send_mail(subject, message, from_email, recipient_list):
+    mail.send_mail(subject, message, from_email, recipient_list)
+
+
+@task
+def make_derivatives(digital_object_id):
+    obj = DigitalObject.objects.filter(id=digital_object_id).first()
+
+    # skip deleted photos, and uploads rendered by an earlier task
+    if obj is not None and obj.derivatives_source != (obj.file.name or ''):
+        obj.make_derivatives()
+
+
+def retry_delay(attempts):
+    seconds = settings.TASK_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.TASK_MAX_RETRY_DELAY))
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renew a running task's lease every third of TASK_TIMEOUT, so a slow
+    but live task is not claimed again by another worker
+    """
+
+    def __init__(self, task_id):
+        super(Heartbeat, self).__init__(daemon=True)
+        self.task_id = task_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.TASK_TIMEOUT / 3):
+                Task.objects.filter(
+                    pk=self.task_id, status=Task.RUNNING).update(
+                    modified_at=timezone.now())
+        finally:
+            # each thread has its own connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+@transaction.atomic
+def claim_task():
+    now = timezone.now()
+    timeout = timedelta(seconds=settings.TASK_TIMEOUT)
+
+    # a dead worker used up the last attempt
+    Task.objects.abandoned(now, timeout).filter(
+        attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, last_error='Abandoned by its worker')
+
+    qs = Task.objects.due(now, timeout)
+    if is_postgresql():
+        # concurrent workers pass over each other's claimed rows
+        qs = qs.select_for_update(skip_locked=True)
+
+    claimed = qs.first()
+    if claimed is not None:
+        claimed.status = Task.RUNNING
+        claimed.attempts += 1
+        claimed.save()
+    return claimed
+
+
+def run_task(claimed):
+    heartbeat = Heartbeat(claimed.pk)
+    heartbeat.start()
+    try:
+        call_task(claimed)
+    finally:
+        heartbeat.stop()
+
+    claimed.save()
+    return claimed
+
+
+def call_task(claimed):
+    try:
+        func = import_string(claimed.name)
+        if not getattr(func, 'is_task', False):
+            raise ImportError('{} is not a task'.format(claimed.name))
+
+        with transaction.atomic():
+            func(*claimed.args, **claimed.kwargs)
+    except Exception:
+        claimed.last_error = traceback.format_exc()
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = Task.QUEUED
+            claimed.run_at = timezone.now() + retry_delay(claimed.attempts)
+        else:
+            claimed.status = Task.FAILED
+    else:
+        claimed.status = Task.DONE
+        claimed.last_error = ''
+
+
+def purge_tasks(days):
+    """Delete tasks that finished more than days ago"""
+    cutoff = timezone.now() - timedelta(days=days)
+    (count, deleted) = Task.objects.filter(
+        status=Task.DONE, modified_at__lt=cutoff).delete()
+    return count
+
+
+def run_pending(limit=None):
+    """Run due tasks until none are left, returns how many ran"""
+    count = 0
+    while limit is None or count < limit:
+        claimed = claim_task()
+        if claimed is None:
+            break
+        run_task(claimed)
+        count += 1
+    return count
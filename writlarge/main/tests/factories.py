@@ -1,9 +1,12 @@
+from io import BytesIO
 import random
 
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.gis.geos.point import Point
+from django.core.files.uploadedfile import SimpleUploadedFile
 import factory
 from factory.fuzzy import BaseFuzzyAttribute
+from PIL import Image
 
 from writlarge.main.models import (
     LearningSiteCategory, LearningSite, LearningSiteRelationship,
@@ -17,6 +20,12 @@ class FuzzyPoint(BaseFuzzyAttribute):
                      random.uniform(-90.0, 90.0))
 
 
+def photo_upload(name='photo.png', size=(1600, 1200), mode='RGB'):
+    buf = BytesIO()
+    Image.new(mode, size, 'red').save(buf, 'PNG')
+    return SimpleUploadedFile(name, buf.getvalue(), 'image/png')
+
+
 class ExtendedDateFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = ExtendedDate
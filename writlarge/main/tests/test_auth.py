@@ -3,6 +3,7 @@ from django.test.utils import override_settings
 
 from writlarge.main.tests.factories import UserFactory, GroupFactory
 from writlarge.main.auth import EditorMapper
+from writlarge.main.utils import editor_version_name, get_cache_version
 
 
 @override_settings(WIND_STAFF_MAPPER_GROUPS=['foo.bar.local:columbia.edu'])
@@ -23,3 +24,9 @@ class TestWagtailEditorMapper(TestCase):
         self.mapper.map(self.user, ['foo', 'foo.bar.local:columbia.edu'])
         self.assertEqual(self.user.groups.count(), 1)
         self.assertEqual(self.user.groups.first(), self.editor)
+
+    def test_map_expires_editor_status(self):
+        version = get_cache_version(editor_version_name(self.user.pk))
+        self.mapper.map(self.user, ['foo'])
+        self.assertNotEqual(
+            get_cache_version(editor_version_name(self.user.pk)), version)
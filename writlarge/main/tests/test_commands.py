@@ -0,0 +1,238 @@
+import csv
+from io import StringIO
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase
+
+from writlarge.main.management.commands.import_sites import (
+    Command as ImportCommand)
+from writlarge.main.models import Audience, DigitalObject, LearningSite
+from writlarge.main.tests.factories import (
+    ArchivalRepositoryFactory, LearningSiteCategoryFactory,
+    LearningSiteFactory, PlaceFactory, UserFactory, photo_upload)
+
+
+class UpdateSiteDisplayFieldsTest(TestCase):
+
+    def test_command(self):
+        site = LearningSiteFactory()
+        LearningSite.objects.update(
+            established_year=None, defunct_year=None,
+            date_display='? - ?', site_group='other', is_empty=True)
+
+        out = StringIO()
+        call_command('update_site_display_fields', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Updated 1 sites')
+
+        site.refresh_from_db()
+        self.assertEqual(site.get_year_range(), (1984, 1984))
+        self.assertEqual(site.established_defunct_display(),
+                         'c. 1984 - c. 1984')
+        self.assertEqual(site.group(), 'school')
+        self.assertFalse(site.empty())
+
+
+class MakeDerivativesTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_command(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            obj = DigitalObject.objects.create(
+                description='Photo', file=photo_upload())
+            DigitalObject.objects.update(
+                derivatives_source='', thumbnail=None, thumbnail_width=None)
+            DigitalObject.objects.create(
+                description='Link', source_url='https://example.com/a.jpg')
+
+            out = StringIO()
+            call_command('make_derivatives', stdout=out)
+            self.assertEqual(out.getvalue().strip(), 'Rendered 1 photos')
+
+            obj.refresh_from_db()
+            self.assertEqual(obj.thumbnail_width, 320)
+            self.assertRegex(
+                obj.thumbnail.name, r'-thumbnail\.[0-9a-f]{12}\.jpg$')
+
+            out = StringIO()
+            call_command('make_derivatives', stdout=out)
+            self.assertEqual(out.getvalue().strip(), 'Rendered 0 photos')
+
+
+class ImportSitesTest(TestCase):
+
+    csv = (
+        'title,category,target_audience,tags,established,defunct,places\n'
+        'Site Alpha,School,Adults,harlem|music,1918,1932,'
+        '"40.8075,-73.9626|40.69,-73.99"\n'
+        'Site Beta,,,,approximately 1983,,\n'
+        'Site Gamma,Unknown,,,,,\n'
+        'Site Delta,,,,someday,,\n'
+    )
+
+    def setUp(self):
+        LearningSiteCategoryFactory(name='School')
+        Audience.objects.create(name='Adults')
+        self.user = UserFactory()
+
+    def write(self, suffix, content):
+        (fd, path) = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_sites(self, path, *args):
+        (out, err) = (StringIO(), StringIO())
+        call_command('import_sites', path, *args, stdout=out, stderr=err)
+        return (out.getvalue(), err.getvalue())
+
+    def test_csv(self):
+        path = self.write('.csv', self.csv)
+        (out, err) = self.import_sites(
+            path, '--batch-size', '1', '--user', self.user.username)
+
+        self.assertIn('Imported 2 sites, skipped 2 rows', out)
+        self.assertIn('Row 3: unknown category "Unknown"', err)
+        self.assertIn('Row 4: unrecognized date "someday"', err)
+
+        site = LearningSite.objects.get(title='Site Alpha')
+        self.assertEqual(site.created_by, self.user)
+        self.assertEqual(site.modified_by, self.user)
+        self.assertEqual(site.category.first().name, 'School')
+        self.assertEqual(site.target_audience.first().name, 'Adults')
+        self.assertEqual(sorted(site.tags_display()), ['harlem', 'music'])
+        self.assertEqual(site.place.count(), 2)
+        self.assertEqual(site.get_year_range(), (1918, 1932))
+        self.assertEqual(site.established.lower.year, 1918)
+        self.assertEqual(site.group(), 'school')
+        self.assertFalse(site.empty())
+
+        site = LearningSite.objects.get(title='Site Beta')
+        self.assertEqual(site.established.edtf_format, '1983~')
+        self.assertEqual(site.established_defunct_display(), 'c. 1983 - ?')
+        self.assertTrue(site.empty())
+
+        # a second run skips the existing titles
+        (out, err) = self.import_sites(path)
+        self.assertIn('Imported 0 sites, skipped 4 rows', out)
+
+    def test_repeated_values(self):
+        path = self.write('.csv', (
+            'title,category,tags\n'
+            'Site Alpha,School|school,harlem|Harlem|harlem\n'))
+        (out, err) = self.import_sites(path)
+        self.assertIn('Imported 1 sites, skipped 0 rows', out)
+
+        site = LearningSite.objects.get(title='Site Alpha')
+        self.assertEqual(site.category.count(), 1)
+        self.assertEqual(site.tags_display(), ['harlem'])
+
+    def test_failed_batch(self):
+        path = self.write('.csv', (
+            'title,tags\n'
+            'Site Alpha,harlem\n'
+            'Site Beta,harlem\n'))
+
+        original = ImportCommand.write_relations
+        failed = []
+
+        def write_relations(command, records):
+            # fail the first batch after its tags have been created
+            original(command, records)
+            if not failed:
+                failed.append(records)
+                raise IntegrityError('boom')
+
+        with patch.object(ImportCommand, 'write_relations', write_relations):
+            (out, err) = self.import_sites(path, '--batch-size', '1')
+
+        self.assertIn('Imported 1 sites, skipped 1 rows', out)
+        self.assertIn('Batch of 1 sites failed: boom', err)
+
+        # the second batch does not reuse the rolled back tag
+        site = LearningSite.objects.get(title='Site Beta')
+        self.assertEqual(site.tags_display(), ['harlem'])
+        self.assertFalse(LearningSite.objects.filter(title='Site Alpha'))
+
+    def test_json(self):
+        rows = [
+            {'title': 'Site Alpha', 'category': ['school'],
+             'established': 1918, 'is_defunct': False,
+             'places': ['40.8075,-73.9626']},
+            {'title': 'Site Beta', 'places': ['not a place']},
+        ]
+        path = self.write('.json', '\n'.join(json.dumps(r) for r in rows))
+        (out, err) = self.import_sites(path)
+
+        self.assertIn('Imported 1 sites, skipped 1 rows', out)
+        self.assertIn('Row 2: invalid place "not a place"', err)
+
+        site = LearningSite.objects.get(title='Site Alpha')
+        self.assertFalse(site.is_defunct)
+        self.assertEqual(site.place.first().latitude(), 40.8075)
+
+    def test_dry_run(self):
+        path = self.write('.csv', self.csv)
+        (out, err) = self.import_sites(path, '--dry-run')
+
+        self.assertIn('Would import 2 sites, skipped 2 rows', out)
+        self.assertEqual(LearningSite.objects.count(), 0)
+
+    def test_invalid(self):
+        path = self.write('.txt', '')
+        with self.assertRaises(CommandError):
+            self.import_sites(path)
+
+        with self.assertRaises(CommandError):
+            self.import_sites(self.write('.csv', self.csv), '--user', 'x')
+
+
+class ExportDataTest(TestCase):
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_data', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv(self):
+        site = LearningSiteFactory(title='Site Alpha')
+        site.tags.add('harlem', 'music')
+
+        rows = list(csv.DictReader(StringIO(self.export('site'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Site Alpha')
+        self.assertEqual(rows[0]['tags'], 'harlem|music')
+        self.assertEqual(rows[0]['established'], '1984~')
+
+    def test_ndjson(self):
+        PlaceFactory(title='Place Alpha')
+        PlaceFactory(title='Place Beta')
+
+        lines = self.export('place', '--format', 'ndjson').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['title'], 'Place Alpha')
+
+    def test_geojson_output(self):
+        repository = ArchivalRepositoryFactory()
+
+        (fd, path) = tempfile.mkstemp(suffix='.geojson')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.export('repository', '--format', 'geojson', '--output', path)
+
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data['type'], 'FeatureCollection')
+        feature = data['features'][0]
+        self.assertEqual(feature['id'], repository.id)
+        self.assertEqual(feature['geometry']['type'], 'Point')
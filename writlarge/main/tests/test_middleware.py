@@ -0,0 +1,56 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+from django.test.testcases import TestCase
+
+from writlarge.main.middleware import WhodidMiddleware
+from writlarge.main.models import LearningSite
+from writlarge.main.tests.factories import LearningSiteFactory, UserFactory
+
+
+class WhodidMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.site = LearningSiteFactory(created_by=None)
+
+    def save_site(self, request):
+        self.site.title = 'Site Alpha'
+        self.site.save()
+        return request
+
+    def test_write(self):
+        request = RequestFactory().post('/')
+        request.user = self.user
+        WhodidMiddleware(self.save_site)(request)
+
+        site = LearningSite.objects.get(id=self.site.id)
+        self.assertEqual(site.created_by, self.user)
+        self.assertEqual(site.modified_by, self.user)
+
+    def test_anonymous_write(self):
+        self.site.modified_by = self.user
+        self.site.save()
+
+        request = RequestFactory().post('/')
+        request.user = AnonymousUser()
+        WhodidMiddleware(self.save_site)(request)
+
+        site = LearningSite.objects.get(id=self.site.id)
+        self.assertIsNone(site.modified_by)
+
+    def test_read(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        WhodidMiddleware(self.save_site)(request)
+
+        site = LearningSite.objects.get(id=self.site.id)
+        self.assertIsNone(site.modified_by)
+
+    def test_outside_request(self):
+        request = RequestFactory().post('/')
+        request.user = self.user
+        WhodidMiddleware(lambda request: request)(request)
+
+        self.save_site(None)
+        site = LearningSite.objects.get(id=self.site.id)
+        self.assertIsNone(site.modified_by)
@@ -1,10 +1,14 @@
+from datetime import date
+
 from django.test.client import RequestFactory
 from django.test.testcases import TestCase
 
-from writlarge.main.mixins import LearningSiteSearchMixin
-from writlarge.main.models import LearningSite
+from django.contrib.gis.geos import Point
+
+from writlarge.main.mixins import LearningSiteSearchMixin, SpatialFilterMixin
+from writlarge.main.models import InstructionalLevel, LearningSite, Place
 from writlarge.main.tests.factories import (
-    LearningSiteFactory, ExtendedDateFactory)
+    LearningSiteFactory, ExtendedDateFactory, PlaceFactory)
 from django.contrib.auth.models import AnonymousUser
 
 
@@ -47,6 +51,16 @@ class LearningSiteSearchMixinTest(TestCase):
         qs = mixin.filter(LearningSite.objects.all())
         self.assertEqual(qs.count(), 3)
 
+    def test_filter_years_not_four_digits(self):
+        mixin = LearningSiteSearchMixin()
+
+        for (start, end) in (('1800', '20000'), ('abc1999', '2000')):
+            mixin.request = RequestFactory().get(
+                '/', {'q': '', 'start': start, 'end': end})
+            mixin.request.user = AnonymousUser()
+            qs = mixin.filter(LearningSite.objects.all())
+            self.assertEqual(qs.count(), 3)
+
     def test_filter_years_valid_range(self):
         mixin = LearningSiteSearchMixin()
         mixin.request = RequestFactory().get(
@@ -90,6 +104,14 @@ class LearningSiteSearchMixinTest(TestCase):
         self.assertEqual(qs.count(), 1)
         self.assertEqual(qs.first(), self.site1)
 
+    def test_process_full_text(self):
+        mixin = LearningSiteSearchMixin()
+
+        qs = mixin._process_full_text(
+            LearningSite.objects.all(), ['alpha', 'first site'])
+        self.assertTrue('rank' in qs.query.annotations)
+        self.assertTrue('@@' in str(qs.query))
+
     def test_tokenize(self):
         mixin = LearningSiteSearchMixin()
 
@@ -145,6 +167,28 @@ class LearningSiteSearchMixinTest(TestCase):
         qs = mixin._process_years(all, 1800, 1812)
         self.assertEqual(qs.count(), 0)
 
+    def test_process_years_active(self):
+        mixin = LearningSiteSearchMixin()
+
+        dt = ExtendedDateFactory(edtf_format='1990')
+        site4 = LearningSiteFactory(
+            title='Site Delta', established=dt, is_defunct=False)
+        site5 = LearningSiteFactory(
+            title='Site Epsilon', established=None, defunct=None,
+            is_defunct=False)
+
+        all = LearningSite.objects.all()
+
+        qs = mixin._process_years(all, 2000, 2010)
+        self.assertEqual(qs.count(), 1)
+        self.assertTrue(site4 in qs)
+
+        qs = mixin._process_years(all, 1980, date.today().year)
+        self.assertEqual(qs.count(), 3)
+        self.assertTrue(self.site1 in qs)
+        self.assertTrue(site4 in qs)
+        self.assertTrue(site5 in qs)
+
     def test_filter_null_characters_q(self):
         mixin = LearningSiteSearchMixin()
         mixin.request = RequestFactory().get(
@@ -168,3 +212,78 @@ class LearningSiteSearchMixinTest(TestCase):
         mixin.request.user = AnonymousUser()
         qs = mixin.filter(LearningSite.objects.all())
         self.assertEqual(qs.count(), 3)
+
+    def filter_facets(self, params):
+        mixin = LearningSiteSearchMixin()
+        mixin.request = RequestFactory().get('/', params)
+        mixin.request.user = AnonymousUser()
+        return list(mixin._process_facets(LearningSite.objects.all()))
+
+    def test_process_facets(self):
+        level = InstructionalLevel.objects.create(name='Primary')
+        self.site1.instructional_level.add(level)
+        self.site1.verified = True
+        self.site1.save()
+
+        category = self.site2.category.first()
+        self.site3.category.add(category)
+
+        self.assertEqual(len(self.filter_facets({})), 3)
+        self.assertEqual(
+            self.filter_facets({'level': level.id}), [self.site1])
+        self.assertEqual(self.filter_facets({'verified': 'true'}),
+                         [self.site1])
+        self.assertEqual(len(self.filter_facets({'verified': 'false'})), 2)
+        self.assertEqual(self.filter_facets({'tag': 'red'}), [self.site3])
+        self.assertEqual(
+            self.filter_facets({'decade': ['1910', '1980']}),
+            [self.site1, self.site3])
+        self.assertEqual(
+            self.filter_facets({'category': category.id}),
+            [self.site2, self.site3])
+        self.assertEqual(
+            self.filter_facets({'category': category.id, 'tag': 'red'}),
+            [self.site3])
+        self.assertEqual(len(self.filter_facets({'group': 'school'})), 3)
+        self.assertEqual(len(self.filter_facets({'group': 'other'})), 0)
+
+    def test_process_facets_invalid(self):
+        self.assertEqual(len(self.filter_facets(
+            {'level': 'x', 'decade': '\x00', 'verified': 'maybe'})), 3)
+
+
+class SpatialFilterMixinTest(TestCase):
+
+    def setUp(self):
+        # Columbia University & Brooklyn Museum, roughly 16km apart
+        self.columbia = PlaceFactory(latlng=Point(-73.9626, 40.8075))
+        self.brooklyn = PlaceFactory(latlng=Point(-73.9636, 40.6712))
+
+    def filter(self, params):
+        mixin = SpatialFilterMixin()
+        mixin.request = RequestFactory().get('/', params)
+        return mixin.filter_spatial(Place.objects.all(), 'latlng')
+
+    def test_bbox(self):
+        qs = self.filter({'bbox': '-74.0,40.75,-73.9,40.85'})
+        self.assertEqual(list(qs), [self.columbia])
+
+        qs = self.filter({'bbox': '-74.0,40.6,-73.9,40.85'})
+        self.assertEqual(qs.count(), 2)
+
+    def test_near(self):
+        qs = self.filter({'near': '40.8075,-73.9626', 'radius': '1000'})
+        self.assertEqual(list(qs), [self.columbia])
+
+        qs = self.filter({'near': '40.8075,-73.9626', 'radius': '20000'})
+        self.assertEqual(qs.count(), 2)
+
+    def test_invalid(self):
+        for params in [{'bbox': 'abc'}, {'bbox': '1,2,3'},
+                       {'bbox': '-73.9,40.6,-74.0,40.85'},
+                       {'bbox': '-200,40.6,-73.9,40.85'},
+                       {'near': '40.8075,-73.9626'},
+                       {'near': '40.8075,-73.9626', 'radius': '-1'},
+                       {'near': '140.8075,-73.9626', 'radius': '1'},
+                       {'near': '\x00', 'radius': '1'}]:
+            self.assertEqual(self.filter(params).count(), 2)
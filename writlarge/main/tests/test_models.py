@@ -1,12 +1,24 @@
 from datetime import date
-
-from django.test import TestCase
-
-from writlarge.main.models import Place, ExtendedDate, LearningSite
+import os
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from writlarge.main.images import open_image
+from writlarge.main.models import (
+    DigitalObject, Place, ExtendedDate, LearningSite, LearningSiteAdjacency,
+    LearningSiteRelationship)
 from writlarge.main.tests.factories import (
     ExtendedDateFactory, LearningSiteFactory,
     LearningSiteRelationshipFactory, ArchivalCollectionSuggestionFactory,
-    ArchivalRepositoryFactory, ArchivalCollectionFactory, PlaceFactory)
+    ArchivalRepositoryFactory, ArchivalCollectionFactory, PlaceFactory,
+    photo_upload)
+from writlarge.main.tasks import run_pending
+from writlarge.main.utils import get_cache_version
 
 
 class ExtendedDateTest(TestCase):
@@ -170,6 +182,123 @@ class PlaceTest(TestCase):
         self.assertFalse(place.match_string('12.34,56.789'))
 
 
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DigitalObjectTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super(DigitalObjectTest, cls).tearDownClass()
+
+    def test_derivatives(self):
+        obj = DigitalObject.objects.create(
+            description='Photo', file=photo_upload())
+        self.assertFalse(obj.thumbnail)
+
+        self.assertEqual(run_pending(), 1)
+        obj.refresh_from_db()
+
+        self.assertEqual((obj.width, obj.height), (1600, 1200))
+        self.assertEqual((obj.thumbnail_width, obj.thumbnail_height),
+                         (320, 240))
+        self.assertEqual((obj.display_width, obj.display_height),
+                         (1200, 900))
+        self.assertEqual(obj.derivatives_source, obj.file.name)
+        self.assertTrue(obj.thumbnail.name.startswith('derivatives/'))
+        self.assertRegex(
+            obj.display_webp.name, r'-display\.[0-9a-f]{12}\.webp$')
+        self.assertEqual(obj.thumbnail_url(), obj.thumbnail.url)
+        self.assertEqual(obj.display_url(), obj.display.url)
+
+        # saving again leaves the derivatives be
+        obj.save()
+        self.assertEqual(run_pending(), 0)
+
+    def test_derivatives_expire_pages(self):
+        site = LearningSiteFactory()
+        obj = DigitalObject.objects.create(
+            description='Photo', file=photo_upload())
+        site.digital_object.add(obj)
+        modified_at = obj.modified_at
+        version = get_cache_version('page.site.{}'.format(site.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending()
+        obj.refresh_from_db()
+
+        self.assertGreater(obj.modified_at, modified_at)
+        self.assertGreater(
+            get_cache_version('page.site.{}'.format(site.id)), version)
+
+    def test_replace_and_delete(self):
+        obj = DigitalObject.objects.create(
+            description='Photo', file=photo_upload())
+        run_pending()
+        obj.refresh_from_db()
+        old = obj.thumbnail.path
+
+        obj.file = photo_upload('small.png', (100, 50), 'RGBA')
+        obj.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending()
+        obj.refresh_from_db()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual((obj.thumbnail_width, obj.thumbnail_height),
+                         (100, 50))
+
+        path = obj.thumbnail.path
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_rollback_keeps_files(self):
+        obj = DigitalObject.objects.create(
+            description='Photo', file=photo_upload())
+        run_pending()
+        obj.refresh_from_db()
+        old = obj.thumbnail.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    obj.delete()
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+
+        self.assertTrue(os.path.exists(old))
+
+    def test_decompression_bomb(self):
+        pixels = Image.MAX_IMAGE_PIXELS
+        self.addCleanup(setattr, Image, 'MAX_IMAGE_PIXELS', pixels)
+
+        # past the limit, but short of the 2x that raises on its own
+        Image.MAX_IMAGE_PIXELS = 1500000
+        self.assertIsNone(open_image(photo_upload()))
+
+    def test_not_an_image(self):
+        obj = DigitalObject.objects.create(
+            description='Notes',
+            file=SimpleUploadedFile('notes.txt', b'not an image'))
+        run_pending()
+        obj.refresh_from_db()
+
+        self.assertFalse(obj.thumbnail)
+        self.assertIsNone(obj.width)
+        self.assertEqual(obj.derivatives_source, obj.file.name)
+        self.assertEqual(obj.thumbnail_url(), obj.file.url)
+
+    def test_source_url(self):
+        obj = DigitalObject.objects.create(
+            description='Link', source_url='https://example.com/a.jpg')
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(obj.display_url(), 'https://example.com/a.jpg')
+
+
 class LearningSiteTest(TestCase):
 
     def test_empty_relationships(self):
@@ -189,6 +318,50 @@ class LearningSiteTest(TestCase):
         self.assertEqual(qs.count(), 1)
         self.assertEqual(qs[0], r.site_one)
 
+    def test_adjacencies(self):
+        r = LearningSiteRelationshipFactory()
+        self.assertEqual(r.site_one.connections(), [r.site_two.id])
+        self.assertEqual(r.site_two.connections(), [r.site_one.id])
+
+        # duplicate relationships don't duplicate associates
+        LearningSiteRelationshipFactory(
+            site_one=r.site_two, site_two=r.site_one)
+        self.assertEqual(r.site_one.associates().count(), 1)
+
+        other = LearningSiteFactory()
+        r.site_two = other
+        r.save()
+        self.assertEqual(other.connections(), [r.site_one.id])
+
+        LearningSiteRelationship.objects.all().delete()
+        self.assertFalse(r.site_one.has_connections())
+        self.assertFalse(other.has_connections())
+
+    def test_neighbourhood(self):
+        # a - b - c - d, with c - e - d closing a loop
+        a, b, c, d, e = [LearningSiteFactory() for i in range(5)]
+        for (one, two) in [(a, b), (b, c), (c, d), (c, e), (e, d)]:
+            LearningSiteRelationshipFactory(site_one=one, site_two=two)
+
+        (hops, edges, truncated) = LearningSiteAdjacency.neighbourhood(
+            a.id, 1, 100)
+        self.assertEqual(hops, {a.id: 0, b.id: 1})
+        self.assertEqual(edges, {(a.id, b.id)})
+        self.assertFalse(truncated)
+
+        (hops, edges, truncated) = LearningSiteAdjacency.neighbourhood(
+            b.id, 2, 100)
+        self.assertEqual(hops, {a.id: 1, b.id: 0, c.id: 1,
+                                d.id: 2, e.id: 2})
+        self.assertEqual(len(edges), 5)
+        self.assertTrue((d.id, e.id) in edges)
+
+        (hops, edges, truncated) = LearningSiteAdjacency.neighbourhood(
+            a.id, 4, 3)
+        self.assertEqual(hops, {a.id: 0, b.id: 1, c.id: 2})
+        self.assertEqual(edges, {(a.id, b.id), (b.id, c.id)})
+        self.assertTrue(truncated)
+
     def test_empty(self):
         site = LearningSiteFactory()
         self.assertFalse(site.empty())
@@ -230,6 +403,63 @@ class LearningSiteTest(TestCase):
         site.save()
         self.assertEqual(site.get_year_range(), (1984, 2018))
 
+    def test_display_fields_dates(self):
+        site = LearningSiteFactory()
+        self.assertEqual(
+            site.established_defunct_display(), 'c. 1984 - c. 1984')
+
+        site.defunct.edtf_format = '2018'
+        site.defunct.save()
+        site.refresh_from_db()
+        self.assertEqual(site.get_year_range(), (1984, 2018))
+        self.assertEqual(
+            site.established_defunct_display(), 'c. 1984 - 2018')
+
+        site.is_defunct = False
+        site.save()
+        site.refresh_from_db()
+        self.assertEqual(
+            site.established_defunct_display(), 'c. 1984 - present')
+
+    def test_display_fields_date_deleted(self):
+        site = LearningSiteFactory()
+        site.defunct.delete()
+
+        site.refresh_from_db()
+        self.assertIsNone(site.defunct)
+        self.assertEqual(site.established_defunct_display(), 'c. 1984 - ?')
+        self.assertIsNone(site.defunct_year)
+
+    def test_display_fields_category(self):
+        site = LearningSiteFactory()
+        category = site.category.first()
+
+        site.category.clear()
+        self.assertTrue(site.empty())
+        self.assertEqual(site.group(), 'other')
+        site.refresh_from_db()
+        self.assertTrue(site.empty())
+
+        category.learningsite_set.add(site)
+        site.refresh_from_db()
+        self.assertFalse(site.empty())
+        self.assertEqual(site.group(), 'school')
+
+        category.group = 'library'
+        category.save()
+        site.refresh_from_db()
+        self.assertEqual(site.group(), 'library')
+
+        category.learningsite_set.clear()
+        site.refresh_from_db()
+        self.assertTrue(site.empty())
+
+        site.category.add(category)
+        category.delete()
+        site.refresh_from_db()
+        self.assertTrue(site.empty())
+        self.assertEqual(site.group(), 'other')
+
     def test_places_by_start_date(self):
         site = LearningSiteFactory()
         place1 = site.place.first()
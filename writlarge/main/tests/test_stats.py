@@ -0,0 +1,88 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from writlarge.main.models import Audience, InstructionalLevel, LearningSite
+from writlarge.main.stats import CorpusStats
+from writlarge.main.tests.factories import (
+    ExtendedDateFactory, LearningSiteCategoryFactory, LearningSiteFactory)
+
+
+class CorpusStatsTest(TestCase):
+
+    def setUp(self):
+        self.school = LearningSiteCategoryFactory(name='School')
+        self.library = LearningSiteCategoryFactory(
+            name='Library', group='library')
+        self.level = InstructionalLevel.objects.create(name='Primary')
+        self.audience = Audience.objects.create(name='Adults')
+
+        self.site1 = LearningSiteFactory(
+            established=ExtendedDateFactory(edtf_format='1918'))
+        self.site1.category.set([self.school, self.library])
+        self.site1.instructional_level.add(self.level)
+        self.site1.tags.add('harlem', 'music')
+
+        self.site2 = LearningSiteFactory(
+            established=ExtendedDateFactory(edtf_format='1912'))
+        self.site2.category.set([self.school])
+        self.site2.target_audience.add(self.audience)
+        self.site2.tags.add('harlem')
+
+        self.empty = LearningSiteFactory(established=None, defunct=None)
+        self.empty.category.clear()
+
+    def test_facets(self):
+        stats = CorpusStats().to_dict()
+
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['min_year'], 1912)
+        self.assertEqual(
+            [(c['name'], c['count']) for c in stats['category']],
+            [('Library', 1), ('School', 2)])
+        self.assertEqual(stats['group'], [
+            {'name': 'library', 'count': 1},
+            {'name': 'other', 'count': 1},
+            {'name': 'school', 'count': 1}])
+        self.assertEqual(stats['tag'], [
+            {'name': 'harlem', 'slug': 'harlem', 'count': 2},
+            {'name': 'music', 'slug': 'music', 'count': 1}])
+        self.assertEqual(stats['instructional_level'], [
+            {'id': self.level.id, 'name': 'Primary', 'count': 1}])
+        self.assertEqual(stats['audience'], [
+            {'id': self.audience.id, 'name': 'Adults', 'count': 1}])
+        self.assertEqual(stats['decade'], [{'decade': 1910, 'count': 2}])
+
+    def test_filtered(self):
+        sites = LearningSite.objects.filter(category=self.library)
+        stats = CorpusStats(sites).to_dict()
+
+        self.assertEqual(stats['total'], 1)
+        self.assertEqual(
+            [(c['name'], c['count']) for c in stats['category']],
+            [('Library', 1), ('School', 1)])
+        self.assertEqual(stats['min_year'], 1918)
+
+    def test_query_count(self):
+        # one query per facet, plus the total & min year
+        with CaptureQueriesContext(connection) as ctx:
+            CorpusStats().to_dict()
+        self.assertLessEqual(len(ctx.captured_queries), 9)
+
+    def test_without_min_year(self):
+        with CaptureQueriesContext(connection) as ctx:
+            stats = CorpusStats().to_dict(min_year=False)
+        self.assertNotIn('min_year', stats)
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+
+    def test_for_corpus(self):
+        stats = CorpusStats.for_corpus()
+        self.assertEqual(stats['total'], 2)
+        self.assertEqual(CorpusStats.for_corpus(public=False)['total'], 3)
+
+        with self.assertNumQueries(0):
+            CorpusStats.for_corpus()
+
+        self.site2.tags.add('music')
+        stats = CorpusStats.for_corpus()
+        self.assertEqual(stats['tag'][1]['count'], 2)
@@ -0,0 +1,164 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from writlarge.main.models import Task
+from writlarge.main.tasks import (
+    purge_tasks, retry_delay, run_pending, send_mail, task)
+
+
+CALLS = []
+
+
+@task
+def record(value):
+    CALLS.append(value)
+
+
+@task
+def fail():
+    raise ValueError('unavailable')
+
+
+def unmarked():
+    CALLS.append('unmarked')
+
+
+@override_settings(TASK_RETRY_DELAY=30, TASK_MAX_RETRY_DELAY=100)
+class TaskTest(TestCase):
+
+    def setUp(self):
+        del CALLS[:]
+
+    def test_enqueue(self):
+        t = Task.objects.enqueue(record, 'a')
+        self.assertEqual(t.name, 'writlarge.main.tests.test_tasks.record')
+        self.assertEqual(t.args, ['a'])
+        self.assertEqual(t.status, Task.QUEUED)
+
+    def test_run(self):
+        Task.objects.enqueue(record, 'a')
+        Task.objects.enqueue(record, value='b')
+
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(CALLS, ['a', 'b'])
+        self.assertEqual(
+            Task.objects.filter(status=Task.DONE, attempts=1).count(), 2)
+        self.assertEqual(run_pending(), 0)
+
+    def test_not_due(self):
+        t = Task.objects.enqueue(record, 'a')
+        t.run_at = timezone.now() + timedelta(minutes=1)
+        t.save()
+
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(CALLS, [])
+
+    def test_retry(self):
+        t = Task.objects.enqueue(fail)
+        t.max_attempts = 2
+        t.save()
+
+        before = timezone.now()
+        self.assertEqual(run_pending(), 1)
+        t.refresh_from_db()
+        self.assertEqual(t.status, Task.QUEUED)
+        self.assertEqual(t.attempts, 1)
+        self.assertIn('ValueError: unavailable', t.last_error)
+        self.assertGreaterEqual(t.run_at, before + timedelta(seconds=30))
+
+        # not due until the backoff passes
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        t.refresh_from_db()
+        self.assertEqual(t.status, Task.FAILED)
+        self.assertEqual(t.attempts, 2)
+
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(1), timedelta(seconds=30))
+        self.assertEqual(retry_delay(2), timedelta(seconds=60))
+        self.assertEqual(retry_delay(3), timedelta(seconds=100))
+
+    def test_unmarked(self):
+        t = Task.objects.enqueue(
+            'writlarge.main.tests.test_tasks.unmarked')
+        t.max_attempts = 1
+        t.save()
+
+        run_pending()
+        t.refresh_from_db()
+        self.assertEqual(t.status, Task.FAILED)
+        self.assertEqual(CALLS, [])
+
+    @override_settings(TASK_TIMEOUT=60)
+    def test_abandoned(self):
+        t = Task.objects.enqueue(record, 'a')
+        Task.objects.update(
+            status=Task.RUNNING,
+            modified_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(run_pending(), 1)
+        t.refresh_from_db()
+        self.assertEqual(t.status, Task.DONE)
+
+    @override_settings(TASK_TIMEOUT=60)
+    def test_abandoned_exhausted(self):
+        t = Task.objects.enqueue(record, 'a')
+        Task.objects.update(
+            status=Task.RUNNING, attempts=5,
+            modified_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(CALLS, [])
+        t.refresh_from_db()
+        self.assertEqual(t.status, Task.FAILED)
+
+    @override_settings(TASK_TIMEOUT=60)
+    def test_running(self):
+        Task.objects.enqueue(record, 'a')
+        Task.objects.update(status=Task.RUNNING)
+
+        # the lease has not lapsed
+        self.assertEqual(run_pending(), 0)
+
+    def test_purge(self):
+        old = Task.objects.enqueue(record, 'a')
+        Task.objects.enqueue(record, 'b')
+        run_pending()
+        Task.objects.filter(pk=old.pk).update(
+            modified_at=timezone.now() - timedelta(days=31))
+        queued = Task.objects.enqueue(record, 'c')
+        Task.objects.filter(pk=queued.pk).update(
+            modified_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(purge_tasks(30), 1)
+        self.assertFalse(Task.objects.filter(pk=old.pk).exists())
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_send_mail(self):
+        Task.objects.enqueue(
+            send_mail, 'Subject', 'Message', 'from@example.com',
+            ['to@example.com'])
+        run_pending()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Subject')
+
+    def test_command(self):
+        Task.objects.enqueue(record, 'a')
+
+        out = StringIO()
+        call_command('run_tasks', '--once', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Ran 1 tasks')
+        self.assertEqual(CALLS, ['a'])
+
+        Task.objects.update(modified_at=timezone.now() - timedelta(days=2))
+        call_command(
+            'run_tasks', '--once', '--purge-done-days', '1', stdout=out)
+        self.assertFalse(Task.objects.exists())
@@ -1,7 +1,23 @@
+from datetime import date
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.test.client import RequestFactory
 from django.test.testcases import TestCase
+from django.test.utils import override_settings
+from writlarge.main.middleware import EditorMiddleware
 from writlarge.main.models import ExtendedDate
+from writlarge.main.tests.factories import GroupFactory, UserFactory
 from writlarge.main.utils import (
-    filter_fields, format_date_range, sanitize, validate_integer)
+    EDTFParseCache, ExtendedDateWrapper, bump_cache_version, bump_on_commit,
+    edtf_cache, expire_pages, TileCache, filter_fields, format_date_range,
+    get_cache_version, get_editor_status, parse_byte_range, sanitize,
+    validate_integer, year_range)
 
 
 class TestUtils(TestCase):
@@ -52,6 +68,17 @@ class TestUtils(TestCase):
         self.assertEqual(
             format_date_range(unknown, True, end), '? - 2018')
 
+    def test_year_range(self):
+        this_year = date.today().year
+
+        self.assertEqual(year_range(None, True, None), (None, None))
+        self.assertEqual(year_range(1918, True, None), (1918, 1918))
+        self.assertEqual(year_range(None, True, 1932), (1932, 1932))
+        self.assertEqual(year_range(1918, True, 1932), (1918, 1932))
+        self.assertEqual(year_range(1918, False, 1932), (1918, this_year))
+        self.assertEqual(
+            year_range(None, False, None), (this_year, this_year))
+
     def test_sanitize(self):
         self.assertEqual(sanitize('s\0s'), '')
         self.assertEqual(sanitize('\x00s\x00s'), '')
@@ -67,3 +94,178 @@ class TestUtils(TestCase):
         self.assertEqual(validate_integer(None), '')
         self.assertEqual(validate_integer('\x00'), '')
         self.assertEqual(validate_integer('1'), 1)
+
+    def test_cache_version(self):
+        version = get_cache_version('test')
+        self.assertEqual(get_cache_version('test'), version)
+
+        bump_cache_version('test')
+        self.assertEqual(get_cache_version('test'), version + 1)
+
+        cache.delete('writlarge.version.test')
+        bump_cache_version('test')
+        self.assertIsNotNone(cache.get('writlarge.version.test'))
+
+    def test_bump_on_commit(self):
+        version = get_cache_version('test')
+        pages = get_cache_version('page.site.1')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_on_commit('test')
+            expire_pages(sites=[1, 1])
+            self.assertEqual(get_cache_version('test'), version)
+            self.assertEqual(get_cache_version('page.site.1'), pages)
+
+        self.assertEqual(get_cache_version('test'), version + 1)
+        self.assertEqual(get_cache_version('page.site.1'), pages + 1)
+
+    def test_parse_byte_range(self):
+        self.assertIsNone(parse_byte_range(None, 100))
+        self.assertIsNone(parse_byte_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_byte_range('lines=1-2', 100))
+
+        self.assertEqual(parse_byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_byte_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=-200', 100), (0, 99))
+
+        with self.assertRaises(ValueError):
+            parse_byte_range('bytes=100-', 100)
+        with self.assertRaises(ValueError):
+            parse_byte_range('bytes=9-0', 100)
+        with self.assertRaises(ValueError):
+            parse_byte_range('bytes=-0', 100)
+        with self.assertRaises(ValueError):
+            parse_byte_range('bytes=-10', 0)
+
+
+class TestEDTFParseCache(TestCase):
+
+    def test_parse(self):
+        cache = EDTFParseCache(maxsize=2)
+
+        dt = cache.parse('1984~')
+        self.assertEqual(str(dt), '1984~')
+        self.assertTrue(cache.parse('1984~') is dt)
+        self.assertIsNone(cache.parse('999'))
+        self.assertIsNone(cache.parse('999'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 0)
+        self.assertEqual(stats['size'], 2)
+
+        # the least recently used entry, 1984~, is evicted
+        cache.parse('1918')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.parse('999')
+        self.assertEqual(cache.stats()['hits'], 3)
+        cache.parse('1984~')
+        self.assertEqual(cache.stats()['misses'], 4)
+
+        cache.clear()
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_wrapper(self):
+        edtf_cache.clear()
+        ExtendedDateWrapper.create('1659-06-30')
+        (lower, upper) = ExtendedDateWrapper.create('1659-06-30')
+        self.assertEqual(lower.format(), 'June 30, 1659')
+        self.assertEqual(edtf_cache.stats()['hits'], 1)
+        self.assertEqual(edtf_cache.stats()['misses'], 1)
+
+
+class TestTileCache(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+        override = override_settings(TILE_CACHE_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.cache = TileCache()
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('public', 1, 0, 0))
+        self.cache.set('public', 1, 0, 0, b'tile')
+        self.assertEqual(self.cache.get('public', 1, 0, 0), b'tile')
+        self.assertIsNone(self.cache.get('editor', 1, 0, 0))
+
+    def test_tile_for(self):
+        self.assertEqual(self.cache.tile_for(-73.96, 40.80, 0), (0, 0))
+        self.assertEqual(self.cache.tile_for(-73.96, 40.80, 1), (0, 0))
+        self.assertEqual(self.cache.tile_for(-73.96, 40.80, 10), (301, 384))
+        self.assertEqual(self.cache.tile_for(180, -90, 2), (3, 3))
+
+    def test_purge_point(self):
+        self.cache.set('public', 10, 301, 384, b'tile')
+        self.cache.set('editor', 10, 301, 384, b'tile')
+        self.cache.set('public', 10, 302, 384, b'tile')
+
+        self.cache.purge_point(Point(-73.96, 40.80))
+        self.assertIsNone(self.cache.get('public', 10, 301, 384))
+        self.assertIsNone(self.cache.get('editor', 10, 301, 384))
+        self.assertEqual(self.cache.get('public', 10, 302, 384), b'tile')
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('public', 10, 302, 384))
+
+    def test_year(self):
+        # open-ended ranges run to the current year, a new year re-renders
+        with mock.patch.object(self.cache, 'year', return_value=2025):
+            self.cache.set('public', 1, 0, 0, b'2025')
+            self.assertEqual(self.cache.get('public', 1, 0, 0), b'2025')
+
+        with mock.patch.object(self.cache, 'year', return_value=2026):
+            self.assertIsNone(self.cache.get('public', 1, 0, 0))
+            self.cache.set('public', 1, 0, 0, b'2026')
+            self.assertEqual(self.cache.get('public', 1, 0, 0), b'2026')
+
+        # the previous year's tiles are pruned
+        self.assertEqual(os.listdir(self.cache.root), ['2026'])
+
+
+class TestEditorStatus(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.editor = GroupFactory(name='Editor')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_anonymous(self):
+        self.request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            self.assertFalse(get_editor_status(self.request))
+
+    def test_editor(self):
+        self.assertFalse(get_editor_status(self.request))
+        self.user.groups.add(self.editor)
+        self.assertTrue(get_editor_status(self.request))
+
+    def test_middleware(self):
+        middleware = EditorMiddleware(lambda request: request)
+        request = middleware(self.request)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(request.is_editor)
+            self.assertFalse(request.is_editor)
+
+    @override_settings(EDITOR_STATUS_SESSION_TIMEOUT=60)
+    def test_session(self):
+        self.request.session = {}
+        self.assertFalse(get_editor_status(self.request))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(get_editor_status(self.request))
+
+        # group membership changes expire the session entry
+        self.user.groups.add(self.editor)
+        self.assertTrue(get_editor_status(self.request))
+
+        self.editor.user_set.clear()
+        self.assertFalse(get_editor_status(self.request))
@@ -1,8 +1,16 @@
+from datetime import date
 from json import loads, dumps
-
+import os
+import shutil
+import tempfile
+from unittest import skipIf
+
+from django.contrib.gis.geos import Point
+from django.core import mail
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client, RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls.base import reverse
 
 from writlarge.main.forms import ConnectionForm
@@ -12,9 +20,13 @@ from writlarge.main.serializers import LearningSiteFamilySerializer
 from writlarge.main.tests.factories import (
     UserFactory, LearningSiteFactory, ArchivalRepositoryFactory,
     GroupFactory, ArchivalCollectionFactory, FootnoteFactory,
-    LearningSiteRelationshipFactory, ExtendedDateFactory)
+    LearningSiteRelationshipFactory, ExtendedDateFactory, PlaceFactory,
+    LearningSiteCategoryFactory)
+from writlarge.main.tasks import run_pending
+from writlarge.main.utils import tile_cache
 from writlarge.main.views import (
-    django_settings, DigitalObjectCreateView, ConnectionCreateView, MapView)
+    django_settings, DigitalObjectCreateView, ConnectionCreateView, ExportView,
+    MapView)
 
 
 class BasicTest(TestCase):
@@ -82,6 +94,70 @@ class DetailViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class AnonymousCacheTest(TestCase):
+
+    def setUp(self):
+        self.site = LearningSiteFactory(title='Site Alpha')
+        self.url = reverse('site-detail-view', kwargs={'pk': self.site.id})
+
+    def test_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        token = str(response.context['csrf_token'])
+        self.assertContains(response, token)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.status_code, 200)
+        self.assertContains(cached, 'Site Alpha')
+        self.assertIsNone(cached.context)
+
+        # another visitor gets their own csrf token
+        cached = Client().get(self.url)
+        self.assertContains(cached, 'Site Alpha')
+        self.assertNotContains(cached, token)
+
+    def test_query_string(self):
+        url = reverse('search-view')
+        response = self.client.get(url, {'q': 'alpha'})
+        self.assertEqual(len(response.context['page_obj'].object_list), 1)
+
+        response = self.client.get(url, {'q': 'beta'})
+        self.assertEqual(len(response.context['page_obj'].object_list), 0)
+
+    def test_invalidation(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.title = 'Site Beta'
+            self.site.save()
+        self.assertContains(self.client.get(self.url), 'Site Beta')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.tags.add('harlem')
+        self.assertContains(self.client.get(self.url), 'harlem')
+
+        collection = ArchivalCollectionFactory(
+            collection_title='Collection Gamma')
+        collection_url = reverse(
+            'collection-detail-view', kwargs={'pk': collection.id})
+        self.client.get(collection_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            collection.learning_sites.add(self.site)
+        self.assertContains(self.client.get(self.url), 'Collection Gamma')
+        self.assertContains(self.client.get(collection_url), 'Site Beta')
+
+    def test_editor(self):
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+
+
 class ApiViewTest(TestCase):
 
     def setUp(self):
@@ -113,6 +189,48 @@ class ApiViewTest(TestCase):
                                     HTTP_X_REQUESTED_WITH='XMLHttpRequest')
         self.assertEqual(response.status_code, 403)
 
+    def test_page_size(self):
+        LearningSiteFactory()
+        LearningSiteFactory()
+
+        response = self.client.get('/api/site/', {'page_size': 2})
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(the_json['count'], 3)
+        self.assertEqual(len(the_json['results']), 2)
+        self.assertIsNotNone(the_json['next'])
+
+    def test_cursor(self):
+        LearningSiteFactory(title='Alpha')
+        LearningSiteFactory(title='Beta')
+
+        response = self.client.get(
+            '/api/site/', {'pagination': 'cursor', 'page_size': 2})
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertNotIn('count', the_json)
+        self.assertEqual(
+            [site['title'] for site in the_json['results']],
+            ['Alpha', 'Beta'])
+
+        response = self.client.get(the_json['next'])
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(
+            [site['id'] for site in the_json['results']], [self.site.id])
+        self.assertIsNone(the_json['next'])
+        self.assertIsNotNone(the_json['previous'])
+
+    def test_cursor_modified(self):
+        other = ArchivalRepositoryFactory()
+        self.repository.save()
+
+        response = self.client.get(
+            '/api/repository/', {'pagination': 'cursor', 'page_size': 1})
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(the_json['results'][0]['id'], other.id)
+
+        response = self.client.get(the_json['next'])
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(the_json['results'][0]['id'], self.repository.id)
+
     def test_create(self):
         self.client.login(username=self.user.username, password='test')
         data = {
@@ -160,6 +278,137 @@ class ApiViewTest(TestCase):
         self.assertEqual(family[1]['id'], sib2.id)
         self.assertEqual(family[1]['relationship'], 'associate')
 
+    def test_family_network(self):
+        parent = LearningSiteFactory()
+        sib = LearningSiteFactory()
+        cousin = LearningSiteFactory()
+        LearningSiteRelationshipFactory(site_one=parent, site_two=sib)
+        LearningSiteRelationshipFactory(site_one=cousin, site_two=sib)
+
+        url = '/api/family/{}/'.format(parent.id)
+        the_json = loads(self.client.get(url).content.decode('utf-8'))
+        self.assertIsNone(the_json['network'])
+
+        the_json = loads(self.client.get(
+            url, {'depth': 2}).content.decode('utf-8'))
+        network = the_json['network']
+        self.assertEqual(network['depth'], 2)
+        self.assertEqual([n['id'] for n in network['nodes']],
+                         [parent.id, sib.id, cousin.id])
+        self.assertEqual(network['nodes'][2]['depth'], 2)
+        self.assertEqual(network['nodes'][2]['group'], 'school')
+        self.assertEqual(len(network['edges']), 2)
+        self.assertFalse(network['truncated'])
+
+        the_json = loads(self.client.get(
+            url, {'depth': 100}).content.decode('utf-8'))
+        self.assertEqual(the_json['network']['depth'], 4)
+
+        # lists leave the network out
+        the_json = loads(self.client.get(
+            '/api/family/', {'depth': 2}).content.decode('utf-8'))
+        self.assertTrue(the_json['results'])
+        for site in the_json['results']:
+            self.assertIsNone(site['network'])
+
+    def test_family_query_count(self):
+        parent = LearningSiteFactory()
+        LearningSiteRelationshipFactory(site_one=parent)
+        url = '/api/family/{}/'.format(parent.id)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        expected = len(ctx.captured_queries)
+
+        for i in range(5):
+            LearningSiteRelationshipFactory(site_two=parent)
+
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(len(the_json['family']), 6)
+        self.assertEqual(the_json['family'][0]['group'], 'school')
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_conditional_get(self):
+        for url in ['/api/site/', '/api/place/', '/api/repository/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse('Last-Modified' in response)
+            self.assertNotModified(url, response['ETag'])
+
+        for url in ['/api/site/{}/'.format(self.site.id),
+                    '/api/family/{}/'.format(self.site.id)]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue('Last-Modified' in response)
+            self.assertNotModified(url, response['ETag'])
+
+    def test_list_ignores_if_modified_since(self):
+        url = '/api/repository/'
+        since = self.client.get(
+            '/api/repository/{}/'.format(self.repository.id))[
+            'Last-Modified']
+
+        # a deletion leaves the newest modified_at where it was
+        ArchivalRepositoryFactory().delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_changed(self):
+        url = '/api/site/'
+        etag = self.client.get(url)['ETag']
+
+        # a related place changes
+        place = self.site.place.first()
+        place.title = 'Morningside Heights'
+        place.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # a different page of the same data
+        etag = response['ETag']
+        response = self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.status_code, 304)
+
+        # an older site is removed
+        other = LearningSiteFactory()
+        self.site.save()
+        etag = self.client.get(url)['ETag']
+        other.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get_place_deleted(self):
+        url = '/api/site/'
+        older = PlaceFactory()
+        self.site.place.add(older)
+        self.site.place.exclude(id=older.id).first().save()
+        etag = self.client.get(url)['ETag']
+
+        # the newest place and the row count are unchanged
+        with self.captureOnCommitCallbacks(execute=True):
+            older.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get_family(self):
+        url = '/api/family/{}/'.format(self.site.id)
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LearningSiteRelationshipFactory(site_one=self.site)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(loads(response.content)['family']), 1)
+
 
 class TestLearningSiteUpdateView(TestCase):
 
@@ -563,6 +812,13 @@ class TestArchivalCollectionSuggestionView(TestCase):
         self.assertEqual(collection.title, 'Bar')
         self.assertEqual(collection.latlng, 'SRID=4326;POINT(1 1)')
 
+        # the team is emailed by the task worker, not the request
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/admin/main/archivalcollectionsuggestion/{}/'.format(
+            collection.id), mail.outbox[0].body)
+
 
 class TestFootnoteViews(TestCase):
 
@@ -698,6 +954,15 @@ class SearchViewTest(TestCase):
         self.assertTrue(
             self.site2 in response.context['page_obj'].object_list)
 
+    def test_invalid_years(self):
+        url = reverse('search-view')
+
+        for (start, end) in (('1800', '20000'), ('abc1999', '2000')):
+            response = self.client.get(url, {'start': start, 'end': end})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                len(response.context['page_obj'].object_list), 2)
+
 
 class ConnectionCreateViewTest(TestCase):
 
@@ -763,6 +1028,513 @@ class LearningSiteViewSetTest(TestCase):
         self.assertEqual(len(the_json['results']), 1)
         self.assertEqual(the_json['results'][0]['id'], site1.id)
 
+    def test_display_fields(self):
+        site = LearningSiteFactory()
+        site.tags.add('red')
+
+        response = self.client.get('/api/site/')
+        the_json = loads(response.content.decode('utf-8'))
+        result = the_json['results'][0]
+        self.assertFalse(result['empty'])
+        self.assertEqual(result['tags_display'], ['red'])
+        self.assertEqual(
+            result['established_defunct_display'], 'c. 1984 - c. 1984')
+
+    def test_bbox(self):
+        site = LearningSiteFactory()
+        site.place.add(PlaceFactory(latlng=Point(-73.9626, 40.8075)))
+        LearningSiteFactory()
+
+        response = self.client.get(
+            '/api/site/', {'bbox': '-74.0,40.75,-73.9,40.85'})
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(len(the_json['results']), 1)
+        self.assertEqual(the_json['results'][0]['id'], site.id)
+
+        response = self.client.get(
+            '/api/place/', {'near': '40.8075,-73.9626', 'radius': '500'})
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(len(the_json['results']), 1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count(self):
+        site = LearningSiteFactory()
+        site.tags.add('red')
+
+        self.count_queries('/api/site/')  # warm the content type cache
+        expected = self.count_queries('/api/site/')
+
+        for i in range(14):
+            site = LearningSiteFactory()
+            site.tags.add('blue')
+            site.digital_object.create(description='photo')
+
+        self.assertEqual(self.count_queries('/api/site/'), expected)
+        self.assertEqual(self.count_queries('/api/site/?q=site'), expected)
+
+
+class LearningSiteLayerViewTest(TestCase):
+
+    def setUp(self):
+        self.url = reverse('site-layer-view')
+
+    def test_get(self):
+        dt1 = ExtendedDateFactory(edtf_format='1918')
+        dt2 = ExtendedDateFactory(edtf_format='1932')
+        site = LearningSiteFactory(
+            title='Site Alpha', established=dt1, defunct=dt2)
+        site.place.add(PlaceFactory())
+
+        empty = LearningSiteFactory(title='Site Beta')
+        empty.category.clear()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(the_json['type'], 'FeatureCollection')
+        self.assertEqual(len(the_json['features']), 1)
+
+        feature = the_json['features'][0]
+        self.assertEqual(feature['id'], site.id)
+        self.assertEqual(feature['geometry']['type'], 'MultiPoint')
+        self.assertEqual(len(feature['geometry']['coordinates']), 2)
+        self.assertEqual(feature['properties']['title'], 'Site Alpha')
+        self.assertEqual(feature['properties']['group'], 'school')
+        self.assertEqual(feature['properties']['years'], [1918, 1932])
+
+    def test_get_editor(self):
+        site = LearningSiteFactory(established=None, defunct=None)
+        site.category.clear()
+        site.place.clear()
+
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+        response = self.client.get(self.url)
+        the_json = loads(response.content.decode('utf-8'))
+        self.assertEqual(len(the_json['features']), 1)
+
+        feature = the_json['features'][0]
+        self.assertIsNone(feature['geometry'])
+        self.assertEqual(feature['properties']['group'], 'other')
+        self.assertEqual(feature['properties']['years'], [None, None])
+
+    def test_stored_fields(self):
+        site = LearningSiteFactory()
+        site.category.add(
+            LearningSiteCategoryFactory(name='Archive', group='library'))
+        site.refresh_from_db()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        # the same values as the list & detail endpoints
+        properties = loads(response.content.decode('utf-8'))[
+            'features'][0]['properties']
+        self.assertEqual(properties['group'], site.group())
+        self.assertEqual(properties['group'], 'library')
+        self.assertEqual(properties['years'], list(site.get_year_range()))
+
+
+class PlaceClusterViewTest(TestCase):
+
+    def setUp(self):
+        self.url = reverse('place-cluster-view')
+
+        for (lng, lat) in [(-73.9626, 40.8075), (-73.99, 40.69),
+                           (-71.06, 42.36)]:
+            site = LearningSiteFactory()
+            site.place.clear()
+            site.place.add(PlaceFactory(latlng=Point(lng, lat)))
+
+    def get_clusters(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return loads(response.content.decode('utf-8'))['clusters']
+
+    def test_zoom_required(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get(self):
+        clusters = self.get_clusters({'zoom': 0})
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 3)
+        self.assertEqual(clusters[0]['group'], 'school')
+        self.assertEqual(clusters[0]['groups'], {'school': 3})
+        self.assertAlmostEqual(clusters[0]['bounds'][0], -73.99)
+        self.assertAlmostEqual(clusters[0]['bounds'][3], 42.36)
+
+        clusters = self.get_clusters({'zoom': 8})
+        self.assertEqual([c['count'] for c in clusters], [2, 1])
+        self.assertAlmostEqual(clusters[1]['latitude'], 42.36)
+
+    def test_bbox(self):
+        clusters = self.get_clusters(
+            {'zoom': 0, 'bbox': '-72,42,-70,43'})
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 1)
+
+    def test_empty_sites(self):
+        site = LearningSiteFactory()
+        site.place.update(latlng=Point(-72, 41))
+        site.category.clear()
+
+        clusters = self.get_clusters({'zoom': 0})
+        self.assertEqual(clusters[0]['count'], 3)
+
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+        clusters = self.get_clusters({'zoom': 0})
+        self.assertEqual(clusters[0]['count'], 4)
+
+    def test_invalidation(self):
+        self.assertEqual(self.get_clusters({'zoom': 0})[0]['count'], 3)
+
+        with self.assertNumQueries(0):
+            self.get_clusters({'zoom': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LearningSiteFactory().place.update(latlng=Point(-72, 41))
+        self.assertEqual(self.get_clusters({'zoom': 0})[0]['count'], 4)
+
+
+class MediaViewTest(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+        override = override_settings(
+            MEDIA_ROOT=root, MEDIA_CACHE_MAX_AGE=60)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        os.makedirs(os.path.join(root, 'derivatives'))
+        for name in ('photo.jpg', 'derivatives/photo-thumbnail.abc.jpg'):
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(b'0123456789')
+
+        self.url = reverse('media-view', kwargs={'path': 'photo.jpg'})
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.content(response), b'0123456789')
+
+        url = reverse('media-view', kwargs={
+            'path': 'derivatives/photo-thumbnail.abc.jpg'})
+        response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_missing(self):
+        for path in ('nothing.jpg', 'derivatives', '../settings.py'):
+            url = reverse('media-view', kwargs={'path': path})
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(self.content(response), b'2345')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(self.content(response), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_range(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=2-5',
+            HTTP_IF_RANGE='Tue, 01 Jan 2019 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b'0123456789')
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-uploads/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_SERVE_MODE='x-sendfile')
+    def test_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].endswith('/photo.jpg'))
+
+
+class VectorTileViewTest(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+        override = override_settings(TILE_CACHE_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.site = LearningSiteFactory()
+        self.site.place.clear()
+        self.place = PlaceFactory(latlng=Point(-73.96, 40.80))
+        self.site.place.add(self.place)
+
+    def url(self, z, x, y):
+        return reverse('vector-tile-view', kwargs={'z': z, 'x': x, 'y': y})
+
+    def test_out_of_range(self):
+        response = self.client.get(self.url(1, 2, 0))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self.url(21, 0, 0))
+        self.assertEqual(response.status_code, 404)
+
+    @skipIf(connection.vendor == 'postgresql', 'requires a non-PostGIS db')
+    def test_unsupported(self):
+        response = self.client.get(self.url(10, 301, 384))
+        self.assertEqual(response.status_code, 501)
+
+    def test_cached(self):
+        tile_cache.set('public', 10, 301, 384, b'tile')
+
+        response = self.client.get(self.url(10, 301, 384))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertEqual(response.content, b'tile')
+
+    def test_invalidation(self):
+        tile_cache.set('public', 10, 301, 384, b'tile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.title = 'Morningside Heights'
+            self.place.save()
+        self.assertIsNone(tile_cache.get('public', 10, 301, 384))
+
+        tile_cache.set('public', 10, 301, 384, b'tile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.latlng = Point(-71.06, 42.36)
+            self.place.save()
+        self.assertIsNone(tile_cache.get('public', 10, 301, 384))
+
+        tile_cache.set('editor', 10, 309, 378, b'tile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.category.clear()
+        self.assertIsNone(tile_cache.get('editor', 10, 309, 378))
+
+        tile_cache.set('public', 10, 309, 378, b'tile')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.delete()
+        self.assertIsNone(tile_cache.get('public', 10, 309, 378))
+
+    def test_invalidation_on_commit(self):
+        # a tile rendered before the commit must not survive it
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place.title = 'Morningside Heights'
+            self.place.save()
+            tile_cache.set('public', 10, 301, 384, b'tile')
+            self.assertEqual(
+                tile_cache.get('public', 10, 301, 384), b'tile')
+        self.assertIsNone(tile_cache.get('public', 10, 301, 384))
+
+
+class FacetedSearchViewTest(TestCase):
+
+    def setUp(self):
+        self.url = reverse('faceted-search-view')
+
+        dt = ExtendedDateFactory(edtf_format='1918')
+        self.site1 = LearningSiteFactory(title='Site Alpha', established=dt)
+        self.site1.tags.add('harlem')
+        self.site2 = LearningSiteFactory(title='Site Beta')
+
+    def get_json(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return loads(response.content.decode('utf-8'))
+
+    def test_get(self):
+        the_json = self.get_json({})
+        self.assertEqual(the_json['total'], 2)
+        self.assertEqual(the_json['page'], 1)
+        self.assertEqual(
+            [r['title'] for r in the_json['results']],
+            ['Site Alpha', 'Site Beta'])
+        self.assertEqual(the_json['results'][0]['group'], 'school')
+        self.assertEqual(the_json['results'][0]['years'][0], 1918)
+        self.assertEqual(
+            the_json['facets']['decade'],
+            [{'decade': 1910, 'count': 1}, {'decade': 1980, 'count': 1}])
+
+    def test_filtered(self):
+        the_json = self.get_json({'tag': 'harlem'})
+        self.assertEqual(the_json['total'], 1)
+        self.assertEqual(the_json['results'][0]['id'], self.site1.id)
+        self.assertEqual(
+            the_json['facets']['decade'], [{'decade': 1910, 'count': 1}])
+        self.assertEqual(
+            the_json['facets']['tag'],
+            [{'name': 'harlem', 'slug': 'harlem', 'count': 1}])
+
+    def test_paging(self):
+        the_json = self.get_json({'page': '2'})
+        self.assertEqual(the_json['total'], 2)
+        self.assertEqual(the_json['results'], [])
+
+        the_json = self.get_json({'page': 'x'})
+        self.assertEqual(the_json['page'], 1)
+
+
+class CorpusStatsViewTest(TestCase):
+
+    def test_get(self):
+        LearningSiteFactory().tags.add('harlem')
+        empty = LearningSiteFactory()
+        empty.category.clear()
+
+        url = reverse('corpus-stats-view')
+        the_json = loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual(the_json['total'], 1)
+        self.assertEqual(the_json['group'], [{'name': 'school', 'count': 1}])
+
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+        the_json = loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual(the_json['total'], 2)
+
+
+class ExportViewTest(TestCase):
+
+    def setUp(self):
+        self.site = LearningSiteFactory(title='Site Alpha')
+        LearningSiteRelationshipFactory(site_one=self.site)
+
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_anonymous(self):
+        self.client.logout()
+        url = reverse('export-view', kwargs={'kind': 'site'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_invalid(self):
+        url = reverse('export-view', kwargs={'kind': 'user'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        url = reverse('export-view', kwargs={'kind': 'site'})
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_csv(self):
+        url = reverse('export-view', kwargs={'kind': 'relationship'})
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('writlarge-relationship.csv',
+                      response['Content-Disposition'])
+
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('id,site_one,site_one_title'))
+        self.assertIn('Site Alpha', lines[1])
+
+    def test_geojson(self):
+        url = reverse('export-view', kwargs={'kind': 'site'})
+        response = self.client.get(url, {'format': 'geojson'})
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+
+        the_json = loads(self.content(response))
+        titles = [f['properties']['title'] for f in the_json['features']]
+        self.assertIn('Site Alpha', titles)
+
+        feature = the_json['features'][titles.index('Site Alpha')]
+        self.assertEqual(feature['geometry']['type'], 'MultiPoint')
+        self.assertEqual(len(feature['geometry']['coordinates']), 1)
+
+    def test_non_atomic(self):
+        # the rows are streamed after the request transaction would close
+        view = ExportView.as_view()
+        self.assertIn('default', getattr(view, '_non_atomic_requests'))
+
+
+class TypeaheadViewTest(TestCase):
+
+    def setUp(self):
+        self.url = reverse('typeahead-view')
+        self.site = LearningSiteFactory(title='Free School of Harlem')
+        self.empty = LearningSiteFactory(title='Harlem Reading Room')
+        self.empty.category.clear()
+        self.collection = ArchivalCollectionFactory(
+            collection_title='Harlem Papers')
+
+    def get_json(self, params):
+        response = self.client.get(self.url, params)
+        return response, loads(response.content.decode('utf-8'))
+
+    def test_sites(self):
+        (response, the_json) = self.get_json({'q': 'harlem'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(the_json['results'], [{
+            'id': self.site.id, 'title': 'Free School of Harlem',
+            'type': 'site'}])
+
+        editor = UserFactory()
+        editor.groups.add(GroupFactory(name='Editor'))
+        self.client.login(username=editor.username, password='test')
+
+        (response, the_json) = self.get_json({'q': 'harlem', 'limit': 1})
+        self.assertEqual(len(the_json['results']), 1)
+        (response, the_json) = self.get_json({'q': 'harlem'})
+        self.assertEqual(len(the_json['results']), 2)
+
+    def test_collections(self):
+        (response, the_json) = self.get_json(
+            {'q': 'harlem', 'type': 'collection'})
+        self.assertEqual(len(the_json['results']), 1)
+        self.assertEqual(the_json['results'][0]['id'], self.collection.id)
+
+        (response, the_json) = self.get_json(
+            {'q': 'harlem', 'type': 'repository'})
+        self.assertEqual(len(the_json['results']), 0)
+
+    def test_invalid(self):
+        (response, the_json) = self.get_json({'q': 'h'})
+        self.assertEqual(the_json['results'], [])
+
+        (response, the_json) = self.get_json({'q': '\x00harlem'})
+        self.assertEqual(the_json['results'], [])
+
+        (response, the_json) = self.get_json({'q': 'harlem', 'type': 'x'})
+        self.assertEqual(response.status_code, 400)
+
 
 class MapViewTest(TestCase):
 
@@ -776,3 +1548,37 @@ class MapViewTest(TestCase):
         view = MapView()
         qs = LearningSite.objects.all()
         self.assertEqual(view.get_min_year(qs), 1918)
+
+        with self.assertNumQueries(1):
+            view.get_min_year(qs)
+
+    def test_get_min_year_undated(self):
+        view = MapView()
+        self.assertIsNone(view.get_min_year(LearningSite.objects.all()))
+
+        LearningSiteFactory(established=None, defunct=None)
+        self.assertIsNone(view.get_min_year(LearningSite.objects.all()))
+
+        LearningSiteFactory(
+            established=None, defunct=None, is_defunct=False)
+        self.assertEqual(view.get_min_year(LearningSite.objects.all()),
+                         date.today().year)
+
+        dt = ExtendedDateFactory(edtf_format='1850')
+        LearningSiteFactory(established=dt, defunct=None)
+        self.assertEqual(view.get_min_year(LearningSite.objects.all()), 1850)
+
+    def test_min_year_context(self):
+        url = reverse('map-view')
+        response = self.client.get(url)
+        self.assertEqual(response.context['min_year'], date.today().year)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dt = ExtendedDateFactory(edtf_format='1850')
+            LearningSiteFactory(established=dt, defunct=None)
+        response = self.client.get(url)
+        self.assertEqual(response.context['min_year'], 1850)
+
+        # cached until the corpus changes
+        with self.assertNumQueries(0):
+            self.assertEqual(MapView().get_cached_min_year(2000), 1850)
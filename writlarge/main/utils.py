@@ -1,16 +1,72 @@
+from collections import OrderedDict
 from datetime import date
 from django.utils.html import escape
+import math
+import os
 import re
-
-from django.contrib.auth.models import User
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
 from edtf import parse_edtf
 from edtf.parser.edtf_exceptions import EDTFParseException
 from edtf.parser.parser_classes import (
     EARLIEST, PRECISION_YEAR, PRECISION_MONTH, PRECISION_DAY)
 from rest_framework import permissions
+from rest_framework.pagination import (
+    CursorPagination, PageNumberPagination)
 from rest_framework.renderers import BrowsableAPIRenderer
 
 
+EDITOR_SESSION_KEY = '_writlarge_is_editor'
+
+
+def editor_version_name(user_id):
+    return 'editor.{}'.format(user_id)
+
+
+def get_editor_status(request):
+    """
+    Resolve whether request.user belongs to the Editor group. With
+    EDITOR_STATUS_SESSION_TIMEOUT set, the answer is kept in the session
+    until it expires or the user's editor cache version is bumped.
+    """
+    user = request.user
+    if user.is_anonymous:
+        return False
+
+    timeout = getattr(settings, 'EDITOR_STATUS_SESSION_TIMEOUT', 0)
+    session = getattr(request, 'session', None) if timeout else None
+
+    if session is not None:
+        version = get_cache_version(editor_version_name(user.pk))
+        entry = session.get(EDITOR_SESSION_KEY)
+        if (entry and entry['user'] == user.pk and
+                entry['version'] == version and
+                entry['expires'] > time.time()):
+            return entry['value']
+
+    value = user.groups.filter(name='Editor').exists()
+
+    if session is not None:
+        session[EDITOR_SESSION_KEY] = {
+            'user': user.pk, 'version': version, 'value': value,
+            'expires': time.time() + timeout
+        }
+    return value
+
+
+def request_is_editor(request):
+    # requests that did not pass through EditorMiddleware resolve directly
+    if hasattr(request, 'is_editor'):
+        return bool(request.is_editor)
+    return get_editor_status(request)
+
+
 class IsEditorOrAnonReadOnly(permissions.BasePermission):
     message = 'Adding customers not allowed.'
 
@@ -20,12 +76,8 @@ class IsEditorOrAnonReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        if request.user.is_anonymous:
-            return False
-
         # user must be an editor
-        return User.objects.filter(
-            pk=request.user.id, groups__name='Editor').exists()
+        return request_is_editor(request)
 
 
 class BrowsableAPIRendererNoForms(BrowsableAPIRenderer):
@@ -49,6 +101,49 @@ class BrowsableAPIRendererNoForms(BrowsableAPIRenderer):
         return ""
 
 
+class PageOrCursorPagination(PageNumberPagination):
+    """
+    Page numbers by default. Clients that pass ?pagination=cursor walk
+    the view's cursor_ordering instead, skipping the OFFSET and COUNT(*)
+    queries a deep page costs. Either way ?page_size= picks the size.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+
+    cursor = None
+
+    def get_cursor_paginator(self, view):
+        paginator = CursorPagination()
+        paginator.ordering = view.cursor_ordering
+        paginator.page_size = self.page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.mode_query_param) == 'cursor' and
+                getattr(view, 'cursor_ordering', None)):
+            self.cursor = self.get_cursor_paginator(view)
+            results = self.cursor.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.cursor.display_page_controls
+            return results
+
+        return super(PageOrCursorPagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data)
+        return super(PageOrCursorPagination, self).get_paginated_response(
+            data)
+
+    def get_html_context(self):
+        if self.cursor is not None:
+            return self.cursor.get_html_context()
+        return super(PageOrCursorPagination, self).get_html_context()
+
+
 def filter_fields(request_data, prefix):
     data = dict()
     for k in request_data.keys():
@@ -57,6 +152,156 @@ def filter_fields(request_data, prefix):
     return data
 
 
+class EDTFParseCache(object):
+    """
+    A bounded, least-recently-used cache of parsed EDTF objects keyed on
+    the edtf_format string. Unparseable strings are cached as None.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def parse(self, edtf_format):
+        with self._lock:
+            if edtf_format in self._entries:
+                self._entries.move_to_end(edtf_format)
+                self.hits += 1
+                return self._entries[edtf_format]
+
+        try:
+            edtf_object = parse_edtf(edtf_format)
+        except EDTFParseException:
+            edtf_object = None
+
+        with self._lock:
+            self.misses += 1
+            self._entries[edtf_format] = edtf_object
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return edtf_object
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+
+edtf_cache = EDTFParseCache()
+
+
+class TileCache(object):
+    """
+    Rendered vector tiles on disk at TILE_CACHE_ROOT/year/variant/z/x/y.mvt.
+    Tiles are purged by point, so a change only costs the one tile per
+    zoom level that contains it. Open-ended date ranges are drawn up to
+    the current year, so each year gets a fresh set of tiles.
+    """
+    variants = ('public', 'editor')
+    max_zoom = 20
+    max_latitude = 85.0511287798
+
+    @property
+    def root(self):
+        return settings.TILE_CACHE_ROOT
+
+    def year(self):
+        return date.today().year
+
+    def year_root(self):
+        return os.path.join(self.root, str(self.year()))
+
+    def path(self, variant, z, x, y):
+        return os.path.join(
+            self.year_root(), variant, str(z), str(x), '{}.mvt'.format(y))
+
+    def get(self, variant, z, x, y):
+        try:
+            with open(self.path(variant, z, x, y), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, variant, z, x, y, data):
+        if not os.path.isdir(self.year_root()):
+            self.prune()
+
+        path = self.path(variant, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write aside and rename so readers never see a partial tile
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def tile_for(self, lng, lat, z):
+        n = 2 ** z
+        x = int((lng + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) /
+                2.0 * n)
+        return (min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+    def purge_point(self, point):
+        if point is None or not os.path.isdir(self.year_root()):
+            return
+
+        (lng, lat) = point.coords[:2]
+        if abs(lat) > self.max_latitude:
+            return
+
+        for z in range(self.max_zoom + 1):
+            (x, y) = self.tile_for(lng, lat, z)
+            for variant in self.variants:
+                try:
+                    os.remove(self.path(variant, z, x, y))
+                except OSError:
+                    pass
+
+    def purge_on_commit(self, points):
+        # a tile rendered before the commit would cache the old data again
+        points = [point.clone() for point in points if point is not None]
+
+        def purge():
+            for point in points:
+                self.purge_point(point)
+
+        transaction.on_commit(purge)
+
+    def prune(self):
+        # drop the tiles of past years
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+
+        current = str(self.year())
+        for name in names:
+            if name != current:
+                shutil.rmtree(
+                    os.path.join(self.root, name), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+tile_cache = TileCache()
+
+
 class ExtendedDateWrapper(object):
     month_names = {
         1: 'January', 2: 'February', 3: 'March', 4: 'April',
@@ -70,10 +315,7 @@ class ExtendedDateWrapper(object):
 
     @classmethod
     def _as_edtf_object(cls, edtf_format):
-        try:
-            return parse_edtf(edtf_format)
-        except EDTFParseException:
-            return None
+        return edtf_cache.parse(edtf_format)
 
     @classmethod
     def create(cls, edtf_format):
@@ -238,6 +480,55 @@ class ExtendedDateWrapper(object):
         }
 
 
+def is_postgresql():
+    # full text, trigram & PostGIS-only features degrade gracefully when
+    # running against another backend, e.g. spatialite in the test suite
+    return connection.vendor == 'postgresql'
+
+
+def _cache_version_key(name):
+    return 'writlarge.version.{}'.format(name)
+
+
+def get_cache_version(name):
+    # seeded from the clock so a lost version can't revive stale entries
+    return cache.get_or_set(
+        _cache_version_key(name), lambda: int(time.time() * 1000), None)
+
+
+def bump_cache_version(name):
+    try:
+        cache.incr(_cache_version_key(name))
+    except ValueError:
+        get_cache_version(name)
+
+
+def bump_on_commit(*names):
+    # a request served before the commit would cache the old data under
+    # the new version
+    def bump():
+        for name in names:
+            bump_cache_version(name)
+
+    transaction.on_commit(bump)
+
+
+def expire_pages(sites=(), collections=()):
+    # see AnonymousCacheMixin for the version names each page depends on
+    sites = set(sites)
+    collections = set(collections)
+
+    names = ['page.site.{}'.format(pk) for pk in sites]
+    names.extend('page.collection.{}'.format(pk) for pk in collections)
+    if sites:
+        names.append('page.sites')
+    if collections:
+        names.append('page.collections')
+
+    if names:
+        bump_on_commit(*names)
+
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -266,6 +557,24 @@ def format_date_range(edtf_start, is_ended, edtf_end):
     return '? - ?'
 
 
+def year_range(established, is_defunct, defunct):
+    """
+    Reduce established & defunct years into a (start, end) year tuple.
+    A site that is not defunct is considered active through this year.
+    """
+    if not is_defunct:
+        defunct = date.today().year
+
+    if established and defunct:
+        return (established, defunct)
+    elif established:
+        return (established, established)
+    elif defunct:
+        return (defunct, defunct)
+    else:
+        return (None, None)
+
+
 def sanitize(s):
     if s and '\0' not in s and '\x00' not in s:
         return escape(s)
@@ -278,3 +587,29 @@ def validate_integer(s):
         return int(s)
     except ValueError:
         return ''
+
+
+def parse_byte_range(header, size):
+    """
+    Returns the (first, last) byte positions of a single Range header,
+    or None when there is no range to honour. Raises ValueError when
+    the range can not be satisfied.
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (header or '').strip())
+    if match is None or match.groups() == ('', ''):
+        # missing, malformed & multiple ranges get the whole file
+        return None
+
+    (first, last) = match.groups()
+    if first == '':
+        # a suffix range, the final n bytes
+        if int(last) == 0:
+            raise ValueError('empty suffix range')
+        (first, last) = (max(size - int(last), 0), size - 1)
+    else:
+        first = int(first)
+        last = size - 1 if last == '' else min(int(last), size - 1)
+
+    if first >= size or first > last:
+        raise ValueError('range outside of the file')
+    return (first, last)
@@ -1,43 +1,64 @@
 import datetime
+import hashlib
+from itertools import groupby
+import mimetypes
+import os
+from urllib.parse import quote
 
 from django.conf import settings
 from django.contrib import messages
-from django.core.mail import send_mail
+from django.contrib.gis.db.models.aggregates import Extent
+from django.contrib.gis.db.models.functions import SnapToGrid
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models.aggregates import Count, Max
+from django.db.models.query import Prefetch
+from django.db import connection, transaction
 from django.db.models.query_utils import Q
-from django.http import Http404
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse)
 from django.http.response import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls.base import reverse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import (
     UpdateView, CreateView, DeleteView, FormView)
 from django.views.generic.list import ListView
 from rest_framework import viewsets
+from writlarge.main.export import EXPORTS, FORMATS
 from writlarge.main.forms import (
     ArchivalCollectionCreateForm, ArchivalCollectionUpdateForm,
     ArchivalCollectionSuggestionForm, ConnectionForm,
     ExtendedDateForm, LearningSiteForm, DigitalObjectForm, PlaceForm)
 from writlarge.main.mixins import (
-    LearningSiteParamMixin, LearningSiteRelatedMixin,
-    LoggedInEditorMixin, JSONResponseMixin, LearningSiteSearchMixin,
-    SingleObjectCreatorMixin)
+    AnonymousCacheMixin, ConditionalResponseMixin, LearningSiteParamMixin,
+    LearningSiteRelatedMixin, LoggedInEditorMixin, JSONResponseMixin,
+    LearningSiteSearchMixin, SingleObjectCreatorMixin, SpatialFilterMixin)
 from writlarge.main.models import (
     LearningSite, LearningSiteRelationship, ArchivalRepository, Place,
     DigitalObject, ArchivalCollection, Footnote,
-    ArchivalCollectionSuggestion)
+    ArchivalCollectionSuggestion, LearningSiteAdjacency, Task)
 from writlarge.main.serializers import (
     ArchivalRepositorySerializer, LearningSiteSerializer, PlaceSerializer,
     LearningSiteFamilySerializer)
-from writlarge.main.utils import sanitize, validate_integer
+from writlarge.main.stats import CorpusStats
+from writlarge.main.tasks import send_mail
+from writlarge.main.utils import (
+    get_cache_version, is_postgresql, parse_byte_range, request_is_editor,
+    sanitize, tile_cache, validate_integer, year_range)
 
 
 # returns important setting information for all web pages.
 def django_settings(request):
     whitelist = ['GOOGLE_MAP_API']
     return {
-        'is_editor': (request.user.groups and
-                      request.user.groups.filter(name='Editor').exists()),
+        'is_editor': request_is_editor(request),
         'settings': dict([(k, getattr(settings, k, None))
                           for k in whitelist])}
 
@@ -48,28 +69,40 @@ class CoverView(TemplateView):
 
 class MapView(TemplateView):
     template_name = "main/map.html"
+    cache_timeout = 60 * 60
 
     def get_min_year(self, qs):
-        site = min(
-            qs, key=lambda site: site.get_year_range()[0] or float('inf'))
-        return site.get_year_range()[0]
+        return CorpusStats(qs).min_year()
+
+    def get_cached_min_year(self, default):
+        key = 'writlarge.map.min_year.{}'.format(
+            get_cache_version('corpus'))
+
+        min_year = cache.get(key)
+        if min_year is None:
+            # an undated corpus starts the slider at the default
+            min_year = self.get_min_year(LearningSite.objects.all())
+            if min_year is None:
+                min_year = default
+            cache.set(key, min_year, self.cache_timeout)
+        return min_year
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(MapView, self).get_context_data(**kwargs)
 
-        qs = LearningSite.objects.all().select_related(
-            'established', 'defunct')
-
-        context['min_year'] = self.get_min_year(qs)
         context['max_year'] = datetime.date.today().year
+        context['min_year'] = self.get_cached_min_year(context['max_year'])
         return context
 
 
-class SearchView(LearningSiteSearchMixin, ListView):
+class SearchView(AnonymousCacheMixin, LearningSiteSearchMixin, ListView):
     model = LearningSite
     template_name = "main/search.html"
     paginate_by = 15
 
+    def get_cache_versions(self):
+        return ['page.sites']
+
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(SearchView, self).get_context_data(**kwargs)
 
@@ -118,9 +151,12 @@ class LearningSiteDeleteView(LoggedInEditorMixin, SingleObjectCreatorMixin,
         return reverse('map-view')
 
 
-class LearningSiteDetailView(DetailView):
+class LearningSiteDetailView(AnonymousCacheMixin, DetailView):
     model = LearningSite
 
+    def get_cache_versions(self):
+        return ['page.site.{}'.format(self.kwargs['pk'])]
+
 
 class LearningSiteUpdateView(LoggedInEditorMixin, UpdateView):
     model = LearningSite
@@ -164,9 +200,12 @@ class LearningSiteGalleryView(LearningSiteParamMixin, ListView):
         return self.parent.digital_object.all()
 
 
-class ArchivalCollectionDetailView(DetailView):
+class ArchivalCollectionDetailView(AnonymousCacheMixin, DetailView):
     model = ArchivalCollection
 
+    def get_cache_versions(self):
+        return ['page.collection.{}'.format(self.kwargs['pk'])]
+
 
 class ArchivalCollectionLinkView(LoggedInEditorMixin,
                                  LearningSiteParamMixin,
@@ -275,9 +314,10 @@ class ArchivalCollectionSuggestView(CreateView):
             An archival collection was suggested. See details here: {}
         '''.format(url)
 
-        # Send an email to the team
-        send_mail('Archival Collection Suggested',
-                  msg, settings.SERVER_EMAIL, (settings.CONTACT_US_EMAIL,))
+        # Email the team once the worker picks this up
+        Task.objects.enqueue(
+            send_mail, 'Archival Collection Suggested', msg,
+            settings.SERVER_EMAIL, [settings.CONTACT_US_EMAIL])
 
         return result
 
@@ -317,11 +357,14 @@ class ArchivalCollectionDeleteView(LoggedInEditorMixin,
         return reverse('site-detail-view', args=[self.parent.id])
 
 
-class ArchivalCollectionListView(ListView):
+class ArchivalCollectionListView(AnonymousCacheMixin, ListView):
 
     model = ArchivalCollection
     paginate_by = 20
 
+    def get_cache_versions(self):
+        return ['page.collections']
+
     def get_context_data(self, **kwargs):
         context = super(
             ArchivalCollectionListView, self).get_context_data(**kwargs)
@@ -460,24 +503,480 @@ Rest API endpoints
 """
 
 
-class ArchivalRepositoryViewSet(viewsets.ModelViewSet):
+class ArchivalRepositoryViewSet(ConditionalResponseMixin,
+                                viewsets.ModelViewSet):
     queryset = ArchivalRepository.objects.all().order_by('-modified_at')
     serializer_class = ArchivalRepositorySerializer
+    cursor_ordering = ('modified_at', 'id')
+    etag_aggregates = {'place_modified_at': Max('place__modified_at')}
 
 
-class LearningSiteViewSet(LearningSiteSearchMixin, viewsets.ModelViewSet):
+class LearningSiteViewSet(ConditionalResponseMixin, LearningSiteSearchMixin,
+                          SpatialFilterMixin, viewsets.ModelViewSet):
     serializer_class = LearningSiteSerializer
+    etag_aggregates = {
+        'place_modified_at': Max('place__modified_at'),
+        'object_modified_at': Max('digital_object__modified_at'),
+    }
+    etag_versions = ('corpus', 'page.sites')
+    cursor_ordering = ('title', 'id')
 
     def get_queryset(self):
         qs = LearningSite.objects.all()
-        return self.filter(qs)
+        qs = self.filter(qs)
+        return self.filter_spatial(qs, 'place__latlng')
+
 
+class LearningSiteLayerView(View):
+    """
+    Every visible site as one compact GeoJSON FeatureCollection, built from
+    a single query so the map can paint without paging through /api/site/
+    """
 
-class LearningSiteFamilyViewSet(viewsets.ModelViewSet):
-    queryset = LearningSite.objects.all()
+    def get_queryset(self):
+        qs = LearningSite.objects.all()
+
+        # filter out "empty" sites for anonymous users
+        if self.request.user.is_anonymous:
+            qs = qs.filter(is_empty=False)
+
+        return qs.values(
+            'id', 'title', 'site_group', 'is_defunct', 'established_year',
+            'defunct_year', 'place__latlng').order_by('title', 'id')
+
+    def to_feature(self, rows):
+        site = rows[0]
+        years = year_range(
+            site['established_year'], site['is_defunct'],
+            site['defunct_year'])
+
+        points = [list(row['place__latlng'].coords)
+                  for row in rows if row['place__latlng']]
+
+        return {
+            'type': 'Feature',
+            'id': site['id'],
+            'geometry': {
+                'type': 'MultiPoint', 'coordinates': points
+            } if points else None,
+            'properties': {
+                'title': site['title'],
+                'group': site['site_group'],
+                'years': years
+            }
+        }
+
+    def get(self, *args, **kwargs):
+        rows = groupby(self.get_queryset(), key=lambda row: row['id'])
+        features = [self.to_feature(list(group)) for _id, group in rows]
+
+        return JsonResponse(
+            {'type': 'FeatureCollection', 'features': features},
+            content_type='application/geo+json',
+            json_dumps_params={'separators': (',', ':')})
+
+
+class PlaceClusterView(SpatialFilterMixin, View):
+    """
+    Site places snapped to a grid sized for the map's zoom level. Each
+    cell reports its site count, dominant group and bounds. Results are
+    cached per zoom and bbox until a site or place changes.
+    """
+    cells_per_tile = 4
+    max_zoom = 20
+    cache_timeout = 60 * 15
+
+    def get_queryset(self):
+        qs = LearningSite.objects.all()
+
+        # filter out "empty" sites for anonymous users
+        if self.request.user.is_anonymous:
+            qs = qs.filter(is_empty=False)
+
+        return self.filter_bbox(qs, 'place__latlng')
+
+    def get_cache_key(self, zoom):
+        bbox = hashlib.sha256(
+            self.request.GET.get('bbox', '').encode('utf-8')).hexdigest()
+        return 'writlarge.clusters.{}.{}.{}.{}'.format(
+            get_cache_version('map'), zoom,
+            int(self.request.user.is_anonymous), bbox)
+
+    def merge(self, cells, row):
+        cell = cells.setdefault(row['cell'].coords, {
+            'count': 0, 'groups': {}, 'bounds': list(row['extent'])})
+
+        cell['count'] += row['count']
+        cell['groups'][row['site_group']] = row['count']
+
+        bounds = cell['bounds']
+        cell['bounds'] = [
+            min(bounds[0], row['extent'][0]),
+            min(bounds[1], row['extent'][1]),
+            max(bounds[2], row['extent'][2]),
+            max(bounds[3], row['extent'][3])]
+
+    def get_clusters(self, zoom):
+        # a 256px tile spans 360 / 2^zoom degrees of longitude
+        size = 360.0 / (2 ** zoom) / self.cells_per_tile
+
+        rows = self.get_queryset().annotate(
+            cell=SnapToGrid('place__latlng', size)).values(
+            'cell', 'site_group').annotate(
+            count=Count('id', distinct=True),
+            extent=Extent('place__latlng')).order_by()
+
+        cells = {}
+        for row in rows:
+            if row['cell'] is not None:
+                self.merge(cells, row)
+
+        clusters = []
+        for cell in cells.values():
+            (west, south, east, north) = cell['bounds']
+            clusters.append({
+                'latitude': (south + north) / 2,
+                'longitude': (west + east) / 2,
+                'count': cell['count'],
+                'group': max(sorted(cell['groups']),
+                             key=lambda g: cell['groups'][g]),
+                'groups': cell['groups'],
+                'bounds': cell['bounds']
+            })
+
+        return sorted(clusters, key=lambda c: (-c['count'], c['longitude']))
+
+    def get(self, *args, **kwargs):
+        zoom = validate_integer(self.request.GET.get('zoom', ''))
+        if zoom == '':
+            return JsonResponse({'error': 'zoom is required'}, status=400)
+        zoom = max(0, min(zoom, self.max_zoom))
+
+        key = self.get_cache_key(zoom)
+        clusters = cache.get(key)
+        if clusters is None:
+            clusters = self.get_clusters(zoom)
+            cache.set(key, clusters, self.cache_timeout)
+
+        return JsonResponse({'zoom': zoom, 'clusters': clusters})
+
+
+class VectorTileView(View):
+    """
+    Site places as a Mapbox Vector Tile rendered by PostGIS ST_AsMVT.
+    Each point carries the site id, title, group and start/end years.
+    Rendered tiles are kept on disk until a place or site in them changes.
+    """
+    content_type = 'application/vnd.mapbox-vector-tile'
+    extent = 4096
+    buffer = 64
+
+    sql = """
+        SELECT ST_AsMVT(tile, 'sites', {extent}, 'geom') FROM (
+            SELECT ST_AsMVTGeom(
+                    ST_Transform(p.latlng, 3857),
+                    ST_TileEnvelope(%(z)s, %(x)s, %(y)s),
+                    {extent}, {buffer}, true) AS geom,
+                s.id, s.title, s.site_group AS "group",
+                COALESCE(s.established_year, CASE WHEN s.is_defunct
+                    THEN s.defunct_year ELSE %(year)s END) AS "start",
+                COALESCE(CASE WHEN s.is_defunct
+                    THEN s.defunct_year ELSE %(year)s END,
+                    s.established_year) AS "end"
+            FROM {site} s
+            JOIN {through} sp ON sp.{site_fk} = s.id
+            JOIN {place} p ON p.id = sp.{place_fk}
+            WHERE p.latlng && ST_Transform(
+                ST_TileEnvelope(%(z)s, %(x)s, %(y)s), 4326)
+            AND (%(editor)s OR NOT s.is_empty)
+        ) AS tile WHERE tile.geom IS NOT NULL
+    """
+
+    def get_sql(self):
+        field = LearningSite._meta.get_field('place')
+        return self.sql.format(
+            extent=self.extent, buffer=self.buffer,
+            site=LearningSite._meta.db_table,
+            through=field.remote_field.through._meta.db_table,
+            site_fk=field.m2m_column_name(),
+            place_fk=field.m2m_reverse_name(),
+            place=Place._meta.db_table)
+
+    def render_tile(self, z, x, y):
+        params = {
+            'z': z, 'x': x, 'y': y,
+            'year': tile_cache.year(),
+            'editor': not self.request.user.is_anonymous
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(self.get_sql(), params)
+            row = cursor.fetchone()
+        return bytes(row[0]) if row and row[0] else b''
+
+    def get(self, *args, **kwargs):
+        (z, x, y) = [int(kwargs[k]) for k in ('z', 'x', 'y')]
+        if z > tile_cache.max_zoom or x >= 2 ** z or y >= 2 ** z:
+            raise Http404
+
+        variant = 'public' if self.request.user.is_anonymous else 'editor'
+        data = tile_cache.get(variant, z, x, y)
+        if data is None:
+            if not is_postgresql():
+                return HttpResponse(
+                    'Vector tiles require PostGIS', status=501)
+            data = self.render_tile(z, x, y)
+            tile_cache.set(variant, z, x, y, data)
+
+        return HttpResponse(data, content_type=self.content_type)
+
+
+class CorpusStatsView(View):
+    """
+    Facet counts for the whole corpus: categories, groups, tags,
+    instructional levels, audiences and decades
+    """
+
+    def get(self, *args, **kwargs):
+        stats = CorpusStats.for_corpus(
+            public=self.request.user.is_anonymous)
+        return JsonResponse(stats)
+
+
+class FacetedSearchView(LearningSiteSearchMixin, View):
+    """
+    One page of matching sites along with facet counts for the full
+    filtered result set, so each facet can be narrowed in turn
+    """
+    page_size = 15
+
+    def get_page(self):
+        page = validate_integer(self.request.GET.get('page', ''))
+        return max(page, 1) if page != '' else 1
+
+    def to_result(self, row):
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'group': row['site_group'],
+            'years': year_range(
+                row['established_year'], row['is_defunct'],
+                row['defunct_year'])
+        }
+
+    def get(self, *args, **kwargs):
+        qs = self.filter(LearningSite.objects.all(), True)
+
+        facets = CorpusStats(qs).to_dict(min_year=False)
+        total = facets.pop('total')
+
+        page = self.get_page()
+        offset = (page - 1) * self.page_size
+        rows = qs.prefetch_related(None).values(
+            'id', 'title', 'site_group', 'established_year',
+            'is_defunct', 'defunct_year')[offset:offset + self.page_size]
+
+        return JsonResponse({
+            'total': total,
+            'page': page,
+            'page_size': self.page_size,
+            'results': [self.to_result(row) for row in rows],
+            'facets': facets
+        })
+
+
+class ExportView(LoggedInEditorMixin, View):
+    """
+    Stream a full export of one kind of record as csv, ndjson or geojson
+    """
+
+    # the rows are read after the view returns, by the export's own
+    # transaction rather than the request's
+    @method_decorator(transaction.non_atomic_requests)
+    def dispatch(self, *args, **kwargs):
+        return super(ExportView, self).dispatch(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        kind = kwargs.get('kind')
+        fmt = self.request.GET.get('format', 'csv')
+        if kind not in EXPORTS or fmt not in FORMATS:
+            raise Http404
+
+        response = StreamingHttpResponse(
+            EXPORTS[kind]().stream(fmt), content_type=FORMATS[fmt])
+        response['Content-Disposition'] = \
+            'attachment; filename="writlarge-{}.{}"'.format(kind, fmt)
+        return response
+
+
+def read_file_range(path, first, length, block_size):
+    with open(path, 'rb') as f:
+        f.seek(first)
+        while length > 0:
+            data = f.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+class MediaView(View):
+    """
+    Serve an upload from MEDIA_ROOT. Behind nginx or Apache the file is
+    handed off with X-Accel-Redirect or X-Sendfile, otherwise it is
+    streamed here with Range and If-Modified-Since support.
+    """
+    # derivative names carry a digest of their content, see images.py
+    immutable_prefix = 'derivatives/'
+    block_size = 64 * 1024
+
+    def get_cache_control(self, path):
+        if path.startswith(self.immutable_prefix):
+            return 'public, max-age=31536000, immutable'
+        return 'public, max-age={}'.format(settings.MEDIA_CACHE_MAX_AGE)
+
+    def serve_range(self, fullpath, size, content_type):
+        try:
+            byte_range = parse_byte_range(
+                self.request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+        if byte_range is None:
+            return FileResponse(
+                open(fullpath, 'rb'), content_type=content_type)
+
+        (first, last) = byte_range
+        length = last - first + 1
+        response = StreamingHttpResponse(
+            read_file_range(fullpath, first, length, self.block_size),
+            status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(
+            first, last, size)
+        response['Content-Length'] = length
+        return response
+
+    def serve(self, fullpath, content_type):
+        stat = os.stat(fullpath)
+        last_modified = http_date(stat.st_mtime)
+
+        response = get_conditional_response(
+            self.request, last_modified=int(stat.st_mtime))
+        if response is None:
+            if self.request.headers.get('If-Range', last_modified) \
+                    == last_modified:
+                response = self.serve_range(
+                    fullpath, stat.st_size, content_type)
+            else:
+                # the client's partial copy is stale, start over
+                response = FileResponse(
+                    open(fullpath, 'rb'), content_type=content_type)
+
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = last_modified
+        return response
+
+    def get(self, request, path):
+        try:
+            fullpath = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(fullpath):
+            raise Http404
+
+        content_type = mimetypes.guess_type(fullpath)[0] or \
+            'application/octet-stream'
+
+        if settings.MEDIA_SERVE_MODE == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = \
+                settings.MEDIA_ACCEL_PREFIX + quote(path)
+        elif settings.MEDIA_SERVE_MODE == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = fullpath
+        else:
+            response = self.serve(fullpath, content_type)
+
+        response['Cache-Control'] = self.get_cache_control(path)
+        return response
+
+
+class TypeaheadView(View):
+    """
+    Top matches for a partial title, ranked by trigram similarity on
+    PostgreSQL and falling back to a substring match elsewhere
+    """
+    sources = {
+        'site': (LearningSite, 'title'),
+        'collection': (ArchivalCollection, 'collection_title'),
+        'repository': (ArchivalRepository, 'title'),
+    }
+    min_length = 2
+    default_limit = 10
+    max_limit = 25
+
+    def get_queryset(self, source, q):
+        (model, field) = self.sources[source]
+        qs = model.objects.all()
+
+        # filter out "empty" sites for anonymous users
+        if source == 'site' and self.request.user.is_anonymous:
+            qs = qs.filter(is_empty=False)
+
+        if is_postgresql():
+            lookup = '{}__trigram_word_similar'.format(field)
+            return qs.filter(**{lookup: q}).annotate(
+                similarity=TrigramWordSimilarity(q, field)).order_by(
+                '-similarity', field)
+
+        lookup = '{}__icontains'.format(field)
+        return qs.filter(**{lookup: q}).order_by(field)
+
+    def get_limit(self):
+        limit = validate_integer(self.request.GET.get('limit', ''))
+        if limit == '':
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, *args, **kwargs):
+        source = self.request.GET.get('type', 'site')
+        if source not in self.sources:
+            return JsonResponse(
+                {'error': 'Unknown type {}'.format(sanitize(source))},
+                status=400)
+
+        q = sanitize(self.request.GET.get('q', '')).strip()
+        if len(q) < self.min_length:
+            return JsonResponse({'results': []})
+
+        field = self.sources[source][1]
+        rows = self.get_queryset(source, q).values_list('id', field)
+        results = [{'id': pk, 'title': title, 'type': source}
+                   for (pk, title) in rows[:self.get_limit()]]
+        return JsonResponse({'results': results})
+
+
+class LearningSiteFamilyViewSet(ConditionalResponseMixin,
+                                viewsets.ModelViewSet):
+    queryset = LearningSite.objects.all().prefetch_related(
+        'category', Prefetch(
+            'adjacencies',
+            queryset=LearningSiteAdjacency.objects.select_related(
+                'associate')))
     serializer_class = LearningSiteFamilySerializer
+    etag_aggregates = {
+        'associate_modified_at': Max('adjacencies__associate__modified_at'),
+        'adjacencies': Count('adjacencies', distinct=True),
+    }
+    etag_versions = ('corpus', 'page.sites')
 
 
-class PlaceViewSet(viewsets.ModelViewSet):
-    queryset = Place.objects.all().order_by('-modified_at')
+class PlaceViewSet(ConditionalResponseMixin, SpatialFilterMixin,
+                   viewsets.ModelViewSet):
     serializer_class = PlaceSerializer
+    cursor_ordering = ('modified_at', 'id')
+
+    def get_queryset(self):
+        qs = Place.objects.all().order_by('-modified_at')
+        return self.filter_spatial(qs, 'latlng')
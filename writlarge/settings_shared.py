@@ -65,6 +65,7 @@ INSTALLED_APPS += [  # noqa
     'writlarge.main',
     'taggit',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework',
     'lti_provider',
     'edtf',
@@ -87,6 +88,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'writlarge.main.middleware.EditorMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'writlarge.main.middleware.WhodidMiddleware',
@@ -145,10 +147,30 @@ REST_FRAMEWORK = {
     'PAGINATE_BY': 15,
     'DATETIME_FORMAT': '%m/%d/%y %I:%M %p',
     'DEFAULT_PAGINATION_CLASS':
-        'rest_framework.pagination.PageNumberPagination',
+        'writlarge.main.utils.PageOrCursorPagination',
     'PAGE_SIZE': 15,
 }
 
+# seconds to remember a user's editor status in their session, 0 disables
+EDITOR_STATUS_SESSION_TIMEOUT = 0
+
+# rendered map tiles, see writlarge.main.utils.TileCache
+TILE_CACHE_ROOT = os.path.join(os.path.dirname(base), 'tile_cache')
+
+# writlarge.main.tasks: seconds before the first retry, doubled for each
+# later one up to the max, and before a running task is presumed dead
+TASK_RETRY_DELAY = 30
+TASK_MAX_RETRY_DELAY = 3600
+TASK_TIMEOUT = 600
+
+# how writlarge.main.views.MediaView sends uploads: 'django' streams them
+# with range support, 'x-accel-redirect' hands off to an nginx internal
+# location at MEDIA_ACCEL_PREFIX & 'x-sendfile' to Apache mod_xsendfile
+MEDIA_SERVE_MODE = 'django'
+MEDIA_ACCEL_PREFIX = '/protected-uploads/'
+# seconds browsers may cache an upload, derivatives are cached for a year
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
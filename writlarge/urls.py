@@ -2,7 +2,6 @@ from django.conf import settings
 from django.urls import include, path, re_path
 from django.contrib import admin
 from django.views.generic import TemplateView
-from django.views.static import serve
 from rest_framework import routers
 from django_cas_ng import views as cas_views
 from ctlsettings import views as ctl_views
@@ -16,12 +15,27 @@ router = routers.DefaultRouter()
 router.register(r'site', views.LearningSiteViewSet, basename='site')
 router.register(r'family', views.LearningSiteFamilyViewSet)
 router.register(r'repository', views.ArchivalRepositoryViewSet)
-router.register(r'place', views.PlaceViewSet)
+router.register(r'place', views.PlaceViewSet, basename='place')
 
 urlpatterns = [
     path('', views.CoverView.as_view()),
+    path('api/layer/', views.LearningSiteLayerView.as_view(),
+         name='site-layer-view'),
+    path('api/cluster/', views.PlaceClusterView.as_view(),
+         name='place-cluster-view'),
+    path('api/export/<slug:kind>/', views.ExportView.as_view(),
+         name='export-view'),
+    path('api/search/', views.FacetedSearchView.as_view(),
+         name='faceted-search-view'),
+    path('api/stats/', views.CorpusStatsView.as_view(),
+         name='corpus-stats-view'),
+    path('api/typeahead/', views.TypeaheadView.as_view(),
+         name='typeahead-view'),
     path('api/', include(router.urls)),
 
+    re_path(r'^tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt$',
+            views.VectorTileView.as_view(), name='vector-tile-view'),
+
     path('accounts/login', ctl_views.LoginAPIView.as_view()),
     path('accounts/', include('django.contrib.auth.urls')),
 
@@ -124,8 +138,8 @@ urlpatterns = [
     path('_impersonate/', include('impersonate.urls')),
     path('stats/', TemplateView.as_view(template_name="stats.html")),
     re_path(r'smoketest/', include('smoketest.urls')),
-    re_path(r'^uploads/(?P<path>.*)$',
-            serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^uploads/(?P<path>.*)$', views.MediaView.as_view(),
+            name='media-view'),
     path('lti/', include('lti_provider.urls'))
 ]
 